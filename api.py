@@ -0,0 +1,180 @@
+"""
+Aggregate API on the Flask server.
+
+Endpoints under /api/v1 return the numbers shown by the dashboard:
+
+    /api/v1/flights          daily number of flights
+    /api/v1/monthly-averages daily average flights per month (by_year=0|1)
+    /api/v1/states           number of flights per state
+    /api/v1/top-airports     top airports of both sources (number, statistic)
+
+They take the filters of filter_dataset as query parameters (airports
+and states repeated, start_date and end_date) and movement=total|arrival|
+departure. Responses are JSON or Arrow IPC streams (format=arrow or an
+Accept header of ARROW_MEDIA_TYPE), stored in the response cache and
+tagged with an ETag derived from the dataset version and the query, so
+conditional GETs of an unchanged dataset return 304 without any work.
+"""
+import hashlib
+import json
+import pandas as pd
+from flask import Response, request
+import constants as c
+import data as ds
+import response_cache
+import serialization
+
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+MOVEMENTS = ['total', 'arrival', 'departure']
+
+
+def get_filters():
+    """
+    Returns filter_dataset parameters of the request
+    """
+    filters = {
+        'airports': request.args.getlist('airports') or None,
+        'states': request.args.getlist('states') or None,
+        'start_date': request.args.get('start_date'),
+        'end_date': request.args.get('end_date')
+    }
+    for name in ['start_date', 'end_date']:
+        if filters[name] is not None:
+            filters[name] = pd.to_datetime(filters[name])
+    return filters
+
+
+def get_movement():
+    movement = request.args.get('movement', 'total')
+    if movement not in MOVEMENTS:
+        raise ValueError('movement must be one of {}'.format(', '.join(MOVEMENTS)))
+    return movement
+
+
+def get_flight_columns():
+    """
+    Returns NM and airport columns of the requested movement
+    """
+    movement = get_movement()
+    return [c.TOP_AIRPORTS_COLUMNS[x][movement] for x in c.TOP_AIRPORTS_SOURCES]
+
+
+def get_flag(name):
+    return request.args.get(name, '1').strip().lower() in ('1', 'true', 'yes')
+
+
+def flights():
+    return ds.query_number_of_flights(get_flight_columns(), **get_filters())
+
+
+def monthly_averages():
+    return ds.query_monthly_averages(
+        get_flight_columns(), by_year=get_flag('by_year'), **get_filters()
+    )
+
+
+def states():
+    return ds.query_daily_average_per_state(get_flight_columns(), **get_filters())
+
+
+def top_airports():
+    statistic = request.args.get('statistic', 'average')
+    if statistic not in ('average', 'total'):
+        raise ValueError('statistic must be average or total')
+    result = ds.query_top_airports(
+        number=int(request.args.get('number', 5)),
+        movement=get_movement(),
+        statistic=statistic,
+        **get_filters()
+    )
+    return pd.concat([
+        frame.assign(SOURCE=source) for source, frame in result.items()
+    ], ignore_index=True)
+
+
+ENDPOINTS = {
+    'flights': flights,
+    'monthly-averages': monthly_averages,
+    'states': states,
+    'top-airports': top_airports,
+}
+
+
+def is_arrow_requested():
+    requested = request.args.get('format')
+    if requested is not None:
+        return requested == 'arrow'
+    return request.accept_mimetypes.best_match(
+        ['application/json', ARROW_MEDIA_TYPE]
+    ) == ARROW_MEDIA_TYPE
+
+
+def to_json(frame, version):
+    records = frame.to_json(orient='records', date_format='iso')
+    return '{{"version": {}, "data": {}}}'.format(json.dumps(version), records).encode()
+
+
+def to_arrow(frame, version):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({'version': version})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def get_etag(name, arrow, version):
+    """
+    Returns ETag of the request: same dataset version, query
+    and response cache fingerprint give the same ETag
+    """
+    query = sorted(request.args.items(multi=True))
+    description = json.dumps([name, arrow, query, version, response_cache.fingerprint])
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def serve(name):
+    """
+    Answers a request of the endpoint
+    """
+    snapshot = ds.get_snapshot()
+    arrow = is_arrow_requested()
+    etag = get_etag(name, arrow, snapshot.version)
+    if serialization.is_unchanged(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def compute():
+        frame = ENDPOINTS[name]()
+        if arrow:
+            return to_arrow(frame, snapshot.version)
+        return to_json(frame, snapshot.version)
+
+    try:
+        with ds.pinned_snapshot(snapshot):
+            body = response_cache.get_or_compute(
+                'api-' + name, [arrow, sorted(request.args.items(multi=True))], compute
+            )
+    except (ValueError, KeyError) as error:
+        return Response(
+            json.dumps({'error': str(error)}), status=400, mimetype='application/json'
+        )
+    response = Response(
+        body, mimetype=ARROW_MEDIA_TYPE if arrow else 'application/json'
+    )
+    response.set_etag(etag)
+    return response
+
+
+def init_app(server):
+    """
+    Registers the API routes on the Flask server
+    """
+    for name in ENDPOINTS:
+        server.add_url_rule(
+            '/api/v1/' + name, 'api_' + name.replace('-', '_'),
+            lambda name=name: serve(name)
+        )
@@ -1,18 +1,36 @@
+import logging
+import time
+
+start_time = time.perf_counter()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(process)d] %(name)s %(levelname)s: %(message)s'
+)
+
 import pandas as pd
 import numpy as np
+import api
+import client
 import data as ds
-import json
-from data import dataset
+import export
+import maps
+import pipeline
+import ingest
+import instrumentation
+import response_cache
+import serialization
+import warmup
+import config
 import constants as c
 import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import dash_bootstrap_components as dbc
 from dash import html, dcc, dash_table
 from dash.dash_table.Format import Format, Scheme
 import plotly.graph_objects as go
-import plotly.express as px
-from scipy import signal
-from datetime import date
+from datetime import date, timedelta
+from urllib.parse import urlencode
 
 app = dash.Dash(__name__, external_stylesheets=[
     dbc.themes.BOOTSTRAP,
@@ -23,96 +41,106 @@ app = dash.Dash(__name__, external_stylesheets=[
     ]
 )
 server = app.server
+instrumentation.init_app(server)
+api.init_app(server)
+export.init_app(server)
+maps.init_app(server)
+client.init_app(server)
+serialization.init_app(server)
 
 app.title = 'Airport Traffic Dashboard'
 
-with open('assets/europe.geojson') as file:
-    countries = json.load(file)
-
 container_margins = {"margin-left": "2%", "margin-right": "2%"}
 checklist_margins = {'margin': '2%'}
 checklist_title_margins = {'margin': '3%'}
 
 # TODO: remove sidebar and replace it with horizontal header
 
-header = dbc.Container(children=[
-    dbc.Row([
-        dbc.Col(
-            html.H3('Airport Traffic Dashboard',
-                    style={
-                        'textAlign': 'center'
-                    }),
-            xs=12, md=12, lg=12, xl=12,
-        )
-    ], justify='center',
-        style={'backgroundColor': 'rgb(229, 236, 246)'}),
-    dbc.Row([
-        dbc.Col(
-            html.Div([
-                dcc.Dropdown(
-                    options=[
-                        {'label': x, 'value': x} for x in ds.get_list_of_states(dataset)
-                    ],
-                    id='states_list',
-                    multi=True,
-                    clearable=True,
-                    placeholder='Select States',
-                    style={
-                        'border': '0px',
-                        'borderColor': 'transparent'
-                    }
-                )
-            ]),
-            xs=12, md=12, lg=3, xl=3,
-            align='center'
-        ),
-        dbc.Col(
-            html.Div([
-                dcc.Dropdown(
-                    options=[
-                        {'label': x, 'value': x} for x in ds.get_list_of_airports(dataset)
-                    ],
-                    id='airports_list',
-                    multi=True,
-                    clearable=True,
-                    placeholder='Select Airports',
-                    style={
-                        'border': '0px',
-                        'borderColor': 'transparent'
-                    }
-                )
-            ]), xs=12, md=12, lg=3, xl=3, align='center'
-        ),
-        dbc.Col(
-            html.Div([
-                dcc.DatePickerRange(
-                    id='period_selection',
-                    min_date_allowed=ds.get_date(dataset, min),
-                    max_date_allowed=ds.get_last_date(dataset),
-                    start_date=ds.get_date(dataset, min),
-                    end_date=ds.get_date(dataset, max)
-                )
-            ], className='period_and_movement'
-            ), xs=6, md=6, lg=3, xl=3, align='center'
-        ),
-        dbc.Col(
-            html.Div([
-                dbc.Checklist(
-                    options=[{'label': x, 'value': x} for x in ['Arrival', 'Departure']],
-                    id='ifr_movements',
-                    value=[x for x in ['Arrival', 'Departure']],
-                    switch=True,
-                    inline=True
-                )
-            ], className='period_and_movement'
-            ), xs=6, md=6, lg=3, xl=3, align='center'
+def build_header(summary):
+    """
+    Builds the header with filters matching the dataset summary
+    """
+    return dbc.Container(children=[
+        dbc.Row([
+            dbc.Col(
+                html.H3('Airport Traffic Dashboard',
+                        style={
+                            'textAlign': 'center'
+                        }),
+                xs=12, md=12, lg=12, xl=12,
+            )
+        ], justify='center',
+            style={'backgroundColor': 'rgb(229, 236, 246)'}),
+        dbc.Row([
+            dbc.Col(
+                html.Div([
+                    dcc.Dropdown(
+                        options=ds.get_state_options(),
+                        id='states_list',
+                        multi=True,
+                        clearable=True,
+                        placeholder='Select States',
+                        style={
+                            'border': '0px',
+                            'borderColor': 'transparent'
+                        }
+                    )
+                ]),
+                xs=12, md=12, lg=3, xl=3,
+                align='center'
+            ),
+            dbc.Col(
+                html.Div([
+                    dcc.Dropdown(
+                        options=ds.get_airport_options(),
+                        id='airports_list',
+                        multi=True,
+                        clearable=True,
+                        placeholder='Select Airports',
+                        style={
+                            'border': '0px',
+                            'borderColor': 'transparent'
+                        }
+                    )
+                ]), xs=12, md=12, lg=3, xl=3, align='center'
+            ),
+            dbc.Col(
+                html.Div([
+                    dcc.DatePickerRange(
+                        id='period_selection',
+                        min_date_allowed=ds.format_date(summary.first_date),
+                        max_date_allowed=ds.format_date(summary.last_date + timedelta(days=1)),
+                        start_date=ds.format_date(summary.first_date),
+                        end_date=ds.format_date(summary.last_date)
+                    ),
+                    html.Div([
+                        'Download: ',
+                        html.A('CSV', id='export_csv', href='/export?format=csv'),
+                        ' | ',
+                        html.A('Parquet', id='export_parquet', href='/export?format=parquet')
+                    ], className='export_links')
+                ], className='period_and_movement'
+                ), xs=6, md=6, lg=3, xl=3, align='center'
+            ),
+            dbc.Col(
+                html.Div([
+                    dbc.Checklist(
+                        options=[{'label': x, 'value': x} for x in ['Arrival', 'Departure']],
+                        id='ifr_movements',
+                        value=[x for x in ['Arrival', 'Departure']],
+                        switch=True,
+                        inline=True
+                    )
+                ], className='period_and_movement'
+                ), xs=6, md=6, lg=3, xl=3, align='center'
+            )
+        ],
+        justify='center',
+        className='control_container',
+        style={'margin-bottom': '1%'}
         )
-    ],
-    justify='center',
-    className='control_container',
-    style={'margin-bottom': '1%'}
-    )
-], fluid=True)
+    ], fluid=True)
+
 
 content = html.Div(
     dbc.Container(children=[
@@ -120,6 +148,16 @@ content = html.Div(
             dbc.Col(
                 html.Div([
                     html.H5("Evolution of number of flights", className='section_title'),
+                    dbc.RadioItems(
+                        options=[
+                            {'label': 'Total of the selection', 'value': c.FLIGHTS_MODE_TOTAL},
+                            {'label': 'One line per airport or state', 'value': c.FLIGHTS_MODE_COMPARE}
+                        ],
+                        value=c.FLIGHTS_MODE_TOTAL,
+                        id='flights_mode',
+                        inline=True,
+                        className='section_title'
+                    ),
                     dcc.Graph(
                         id='number_of_flights',
                         config={'displaylogo': False}
@@ -138,6 +176,16 @@ state_summary_container = dbc.Container(
                     "Daily number of flights per state",
                     className='section_title'
                 ),
+                dbc.RadioItems(
+                    options=[
+                        {'label': 'Average over the period', 'value': c.MAP_MODE_PERIOD},
+                        {'label': 'Last day of the period', 'value': c.MAP_MODE_DAY}
+                    ],
+                    value=c.MAP_MODE_PERIOD,
+                    id='map_mode',
+                    inline=True,
+                    className='section_title'
+                ),
                 dcc.Graph(
                     id='map_summary',
                     config={'displaylogo': False}
@@ -162,6 +210,17 @@ combined_container = html.Div([dbc.Container(children=[
         dbc.Col(
             html.Div([
                 html.H5("Seasonal variability of traffic", className='section_title'),
+                dbc.RadioItems(
+                    options=[
+                        {'label': 'All years combined', 'value': c.SEASONAL_MODE_COMBINED},
+                        {'label': 'One line per year', 'value': c.SEASONAL_MODE_YEARS},
+                        {'label': 'Compared to the previous year', 'value': c.SEASONAL_MODE_PREVIOUS}
+                    ],
+                    value=c.SEASONAL_MODE_COMBINED,
+                    id='seasonal_mode',
+                    inline=True,
+                    className='section_title'
+                ),
                 dcc.Graph(
                     id='seasonal_variability',
                     config={'displaylogo': False},
@@ -172,7 +231,7 @@ combined_container = html.Div([dbc.Container(children=[
         dbc.Col([
                 html.Div([
                     html.H5(
-                        "Top 5 Airports",
+                        "Top {} Airports".format(config.TOP_AIRPORTS),
                         className='section_title'
                     ),
                     html.H6(
@@ -187,7 +246,7 @@ combined_container = html.Div([dbc.Container(children=[
         dbc.Col([
                 html.Div([
                     html.H5(
-                        "Top 5 Airports",
+                        "Top {} Airports".format(config.TOP_AIRPORTS),
                         className='section_title'
                     ),
                     html.H6(
@@ -236,14 +295,95 @@ footer = html.Footer(
     )
 )
 
-app.layout = html.Div(children=[
-    header,
-    combined_container,
-    footer
-])
+def get_number_of_flights_layout():
+    return go.Figure(layout=go.Layout(
+        margin={'l': 15, 'r': 15, 't': 20, 'b': 30},
+        # Traces may only have a first date and a step, see serialization.date_axis
+        xaxis={'type': 'date'},
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1,
+        )
+    )).layout
+
+
+def get_comparison_legend():
+    return dict(orientation='v', yanchor='top', y=1, xanchor='left', x=1.02)
 
 
-def generate_table(data, id, source):
+def get_seasonal_layout():
+    return go.Figure(layout=go.Layout(
+        margin={'l': 15, 'r': 15, 't': 20, 'b': 30},
+        height=340,
+        legend=dict(
+            orientation='h',
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )).layout
+
+
+def build_client_stores(summary):
+    """
+    Builds the stores of the client-side mode: aggregates of all states,
+    fetched from their URL once the page is loaded, aggregates of the
+    selected airports and figure templates
+    """
+    return [
+        dcc.Store(id='client_aggregates_url', data=client.AGGREGATES_URL),
+        dcc.Store(id='client_aggregates'),
+        dcc.Interval(id='client_loader', interval=c.CLIENT_LOADER_INTERVAL),
+        dcc.Store(id='client_selection'),
+        dcc.Store(id='client_figures', data={
+            'layouts': {
+                'number_of_flights': get_number_of_flights_layout().to_plotly_json(),
+                'comparison_legend': get_comparison_legend(),
+                'seasonal_variability': get_seasonal_layout().to_plotly_json()
+            },
+            'map': maps.get_map_skeleton(tuple(summary.state_airports))
+        })
+    ]
+
+
+def serve_layout():
+    """
+    Builds the layout on each page load, so that filters
+    follow the dataset after new data is ingested
+    """
+    summary = ds.get_summary()
+    if config.CLIENTSIDE_MODE:
+        stores = build_client_stores(summary)
+    else:
+        stores = []
+    return html.Div(children=[
+        build_header(summary),
+        combined_container,
+        footer
+    ] + stores)
+
+
+app.layout = serve_layout
+
+
+@server.before_first_request
+def start_background_tasks():
+    ingest.start_watcher()
+    if config.FAST_START:
+        warmup.start(get_warmup_calls)
+
+
+@instrumentation.timed_phase('figure')
+def generate_table(top_airports, id):
+    value_column = ds.get_top_airports_value_column()
+    if value_column == c.TOTAL_FLIGHTS:
+        value_name, precision = 'Flights', 0
+    else:
+        value_name, precision = 'Daily average flights', 1
     generated_table = dash_table.DataTable(
         id=id,
         columns=[
@@ -252,10 +392,10 @@ def generate_table(data, id, source):
                 'id': c.AIRPORT_NAME
             },
             {
-                'name': 'Daily average flights',
-                'id': c.DAILY_AVERAGE,
+                'name': value_name,
+                'id': value_column,
                 'type': 'numeric',
-                'format': Format(precision=1, scheme=Scheme.fixed)
+                'format': Format(precision=precision, scheme=Scheme.fixed)
             }
         ],
         style_as_list_view=True,
@@ -269,11 +409,11 @@ def generate_table(data, id, source):
         },
         style_cell_conditional=[
             {
-                'if': {'column_id': c.DAILY_AVERAGE},
+                'if': {'column_id': value_column},
                 'textAlign': 'right'
             }
         ],
-        data=ds.get_top_flight_airports(data, source).to_dict('records')
+        data=top_airports.to_dict('records')
     )
     return generated_table
 
@@ -282,209 +422,305 @@ def generate_table(data, id, source):
     Output('states_list', 'options'),
     Input('airports_list', 'value')
 )
+@instrumentation.timed_callback
 def update_states_list(airports):
-    if airports:
-        filtered_dataset = dataset[
-            dataset[c.AIRPORT_NAME].isin(airports)
-        ]
-        return [{'label': x, 'value': x} for x in ds.get_list_of_states(filtered_dataset)]
-    else:
-        return [{'label': x, 'value': x} for x in ds.get_list_of_states(dataset)]
+    return ds.get_state_options(airports)
 
 
 @app.callback(
     Output('airports_list', 'options'),
     Input('states_list', 'value')
 )
+@instrumentation.timed_callback
 def update_airports_list(states):
-    if states:
-        filtered_dataset = dataset[
-            dataset[c.STATE_NAME].isin(states)
-        ]
-        return [{'label': x, 'value': x} for x in ds.get_list_of_airports(filtered_dataset)]
-    else:
-        return [{'label': x, 'value': x} for x in ds.get_list_of_airports(dataset)]
+    return ds.get_airport_options(states)
 
 
 @app.callback(
-    Output('div_top_5_nm_airports', 'children'),
-    Output('div_top_5_apt_airports', 'children'),
-    Input('states_list', 'value'),
-    Input('period_selection', 'start_date'),
-    Input('period_selection', 'end_date')
-)
-def update_airports_tables(states, start_date, end_date):
-    filtered_dataset = ds.filter_dataset(
-        data=dataset,
-        states=states,
-        start_date=start_date,
-        end_date=end_date
-    )
-    returned_tables = (
-        generate_table(filtered_dataset, 'top_5_nm_airports', 'NM'),
-        generate_table(filtered_dataset, 'top_5_apt_airports', 'APT')
-    )
-    return returned_tables
-
-
-@app.callback(
-    Output('number_of_flights', 'figure'),
+    Output('export_csv', 'href'),
+    Output('export_parquet', 'href'),
     Input('airports_list', 'value'),
     Input('states_list', 'value'),
-    Input('ifr_movements', 'value'),
     Input('period_selection', 'start_date'),
     Input('period_selection', 'end_date')
 )
-def update_number_of_flights_figure(airports, states, ifr_movements, start_date, end_date):
-    filtered_dataset = ds.filter_dataset(
-        data=dataset,
-        airports=airports,
-        states=states,
-        start_date=start_date,
-        end_date=end_date
+@instrumentation.timed_callback
+def update_export_links(airports, states, start_date, end_date):
+    query = urlencode({
+        'airports': airports or [],
+        'states': states or [],
+        'start_date': pd.to_datetime(start_date).strftime('%Y-%m-%d'),
+        'end_date': pd.to_datetime(end_date).strftime('%Y-%m-%d')
+    }, doseq=True)
+    return tuple(
+        '/export?format={}&{}'.format(x, query) for x in ['csv', 'parquet']
     )
 
-    flight_columns = ds.get_flight_columns(ifr_movements)
-
-    graph_data = ds.get_number_of_flights(filtered_dataset, flight_columns)
 
-    chart_layout = go.Layout(
-        margin={'l': 15, 'r': 15, 't': 20, 'b': 30}
-    )
+def make_number_of_flights_figure(graph_data, flight_columns, flights_mode=c.FLIGHTS_MODE_TOTAL):
+    if flights_mode == c.FLIGHTS_MODE_COMPARE:
+        return make_comparison_figure(graph_data)
 
-    fig_number_of_flights = go.Figure(layout=chart_layout)
+    with instrumentation.phase('figure'):
+        fig_number_of_flights = go.Figure(layout=get_number_of_flights_layout())
 
-    fig_number_of_flights.add_trace(
-        go.Scatter(
-            x=graph_data[c.DATE],
-            y=signal.savgol_filter(
-                graph_data[flight_columns[0]], 53, 3
-            ),
-            mode='lines',
-            name='Number of flights (recorded by NM)'
-        )
-    )
-
-    if ds.has_airport_data(graph_data):
+        x, y = graph_data[flight_columns[0]]
         fig_number_of_flights.add_trace(
             go.Scatter(
-                x=graph_data[c.DATE],
-                y=signal.savgol_filter(
-                    graph_data[flight_columns[1]], 53, 3
-                ),
+                **serialization.date_axis(x),
+                y=serialization.round_values(y),
                 mode='lines',
-                name='Number of flights (recorded by airports)',
+                name='Number of flights (recorded by NM)'
             )
         )
 
-    fig_number_of_flights.update_layout(legend=dict(
-        orientation="h",
-        yanchor="bottom",
-        y=1.02,
-        xanchor="right",
-        x=1,
-    ))
-    
+        if flight_columns[1] in graph_data:
+            x, y = graph_data[flight_columns[1]]
+            fig_number_of_flights.add_trace(
+                go.Scatter(
+                    **serialization.date_axis(x),
+                    y=serialization.round_values(y),
+                    mode='lines',
+                    name='Number of flights (recorded by airports)',
+                )
+            )
+
     return fig_number_of_flights
 
 
-@app.callback(
-    Output('seasonal_variability', 'figure'),
-    Input('airports_list', 'value'),
-    Input('states_list', 'value'),
-    Input('ifr_movements', 'value'),
-    Input('period_selection', 'start_date'),
-    Input('period_selection', 'end_date')
-)
-def update_seasonal_variability(airports, states, ifr_movements, start_date, end_date):
-    filtered_dataset = ds.filter_dataset(
-        data=dataset,
-        airports=airports,
-        states=states,
-        start_date=start_date,
-        end_date=end_date
+def make_comparison_figure(graph_data):
+    """
+    Draws one line per compared airport or state
+    """
+    with instrumentation.phase('figure'):
+        fig_number_of_flights = go.Figure(layout=get_number_of_flights_layout())
+        fig_number_of_flights.update_layout(legend=get_comparison_legend())
+        for name, (x, y) in graph_data.items():
+            fig_number_of_flights.add_trace(
+                go.Scatter(
+                    **serialization.date_axis(x),
+                    y=serialization.round_values(y),
+                    mode='lines',
+                    name=name
+                )
+            )
+    return fig_number_of_flights
+
+
+def get_seasonal_traces(graph_data, flight_columns, seasonal_mode):
+    """
+    Returns (x, y, name) of the seasonal variability lines
+    """
+    sources = [(flight_columns[0], 'recorded by NM')]
+    if ds.has_airport_data(graph_data):
+        sources.append((flight_columns[1], 'recorded by airports'))
+
+    if seasonal_mode == c.SEASONAL_MODE_YEARS:
+        return [
+            (
+                months[c.MONTH_MON], months[flight_columns[0]],
+                '{} (recorded by NM)'.format(year)
+            ) for year, months in graph_data.groupby(c.YEAR)
+        ]
+    if seasonal_mode == c.SEASONAL_MODE_PREVIOUS:
+        x = graph_data[c.MONTH_MON] + ' ' + graph_data[c.YEAR].astype(str)
+        traces = []
+        for column, source in sources:
+            traces.append((x, graph_data[column], 'Selected period ({})'.format(source)))
+            traces.append((
+                x, graph_data[column + c.PREVIOUS_YEAR_SUFFIX],
+                'Previous year ({})'.format(source)
+            ))
+        return traces
+    return [
+        (
+            graph_data[c.MONTH_MON], graph_data[column],
+            'Daily average number of flights ({})'.format(source)
+        ) for column, source in sources
+    ]
+
+
+def make_seasonal_figure(graph_data, flight_columns, seasonal_mode):
+    with instrumentation.phase('figure'):
+        fig_seasonal_variability = go.Figure(layout=get_seasonal_layout())
+
+        for x, y, name in get_seasonal_traces(graph_data, flight_columns, seasonal_mode):
+            fig_seasonal_variability.add_trace(
+                go.Scatter(
+                    x=x,
+                    y=serialization.round_values(y),
+                    mode='lines+markers',
+                    name=name
+                )
+            )
+
+    return fig_seasonal_variability
+
+
+def make_map_summary_figure(graph_data, flight_columns, map_mode, start_date, end_date):
+    final_date = pd.to_datetime(end_date)
+    if map_mode == c.MAP_MODE_DAY:
+        title = 'Number of flights<br>on {}'.format(
+            final_date.strftime('%d/%m/%Y')
+        )
+    else:
+        title = 'Daily average flights<br>{} - {}'.format(
+            pd.to_datetime(start_date).strftime('%d/%m/%Y'),
+            final_date.strftime('%d/%m/%Y')
+        )
+
+    return maps.make_map_figure(
+        maps.get_map_skeleton(tuple(ds.get_snapshot().state_airports)),
+        graph_data[c.STATE_NAME],
+        graph_data[flight_columns[0]],
+        title
     )
 
+
+@instrumentation.timed_callback
+@response_cache.cached_callback
+def update_dashboard(airports, states, ifr_movements, start_date, end_date,
+                     seasonal_mode, map_mode, flights_mode):
     flight_columns = ds.get_flight_columns(ifr_movements)
 
-    graph_data = ds.get_average_per_month(filtered_dataset, flight_columns)
+    results = pipeline.run(pipeline.get_dashboard_tasks(
+        flight_columns,
+        airports=airports,
+        states=states,
+        start_date=start_date,
+        end_date=end_date,
+        seasonal_mode=seasonal_mode,
+        map_mode=map_mode,
+        flights_mode=flights_mode
+    ))
 
-    chart_layout = go.Layout(
-        margin={'l': 15, 'r': 15, 't': 20, 'b': 30},
-        height=340
+    return (
+        make_number_of_flights_figure(results['series'], flight_columns, flights_mode),
+        make_seasonal_figure(results['seasonal'], flight_columns, seasonal_mode),
+        generate_table(results['top_airports']['NM'], 'top_5_nm_airports'),
+        generate_table(results['top_airports']['APT'], 'top_5_apt_airports'),
+        make_map_summary_figure(
+            results['map'], flight_columns, map_mode, start_date, end_date
+        )
     )
 
-    fig_seasonal_variability = go.Figure(layout=chart_layout)
 
-    fig_seasonal_variability.add_trace(
-        go.Scatter(
-            x=graph_data[c.MONTH_MON],
-            y=graph_data[flight_columns[0]],
-            mode='lines+markers',
-            name='Daily average number of flights (recorded by NM)'
-        )
+@instrumentation.timed_callback
+@response_cache.cached_callback
+def update_airports_tables(states, start_date, end_date):
+    top_airports = ds.query_top_airports(
+        states=states,
+        start_date=start_date,
+        end_date=end_date
+    )
+    return (
+        generate_table(top_airports['NM'], 'top_5_nm_airports'),
+        generate_table(top_airports['APT'], 'top_5_apt_airports')
     )
-    if ds.has_airport_data(graph_data):
-        fig_seasonal_variability.add_trace(
-            go.Scatter(
-                x=graph_data[c.MONTH_MON],
-                y=graph_data[flight_columns[1]],
-                mode='lines+markers',
-                name='Daily average number of flights (recorded by airports)'
-            )
-        )
 
-    fig_seasonal_variability.update_layout(legend=dict(
-        orientation='h',
-        yanchor="bottom",
-        y=1.02,
-        xanchor="right",
-        x=1
-    ))
 
-    return fig_seasonal_variability
+@instrumentation.timed_callback
+def update_client_selection(airports, states, flights_mode):
+    if not airports:
+        return None
+    return client.get_selection_aggregates(
+        airports, states, flights_mode == c.FLIGHTS_MODE_COMPARE
+    )
 
 
-@app.callback(
-    Output('map_summary', 'figure'),
-    Input('ifr_movements', 'value'),
-    Input('period_selection', 'start_date'),
-    Input('period_selection', 'end_date')
-)
-def update_map_summary(ifr_movements, start_date, end_date):
-    flight_columns = ds.get_flight_columns(ifr_movements)
-    final_date = pd.to_datetime(end_date)
-    filtered_dataset = dataset[
-        dataset[c.DATE].eq(final_date)
-    ]
-    graph_data = ds.get_daily_average_per_state(filtered_dataset, flight_columns)
-    graph_data = graph_data[[c.STATE_NAME, flight_columns[0]]]
-
-    fig_map_summary = px.choropleth(
-        graph_data,
-        geojson=countries,
-        locations=c.STATE_NAME,
-        color=flight_columns[0],
-        color_continuous_scale="Viridis",
-        range_color=(0, max(graph_data[flight_columns[0]])),
-        featureidkey="properties.NAME",
-        scope="europe",
-        labels={
-            flight_columns[0]: 'Number of flights<br>on {}'.format(
-                final_date.strftime('%d/%m/%Y')
-                )
-        },
-        hover_name=c.STATE_NAME,
-        hover_data={
-            c.STATE_NAME: False
-        }
+# In the client-side mode the server only answers the tables and airport
+# selections, the figures are drawn by assets/clientside.js
+if config.CLIENTSIDE_MODE:
+    app.callback(
+        Output('div_top_5_nm_airports', 'children'),
+        Output('div_top_5_apt_airports', 'children'),
+        Input('states_list', 'value'),
+        Input('period_selection', 'start_date'),
+        Input('period_selection', 'end_date')
+    )(update_airports_tables)
+    app.callback(
+        Output('client_selection', 'data'),
+        Input('airports_list', 'value'),
+        Input('states_list', 'value'),
+        Input('flights_mode', 'value')
+    )(update_client_selection)
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='load_aggregates'),
+        Output('client_aggregates', 'data'),
+        Output('client_loader', 'disabled'),
+        Input('client_loader', 'n_intervals'),
+        State('client_aggregates_url', 'data')
     )
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='update_figures'),
+        Output('number_of_flights', 'figure'),
+        Output('seasonal_variability', 'figure'),
+        Output('map_summary', 'figure'),
+        Input('client_aggregates', 'data'),
+        Input('client_selection', 'data'),
+        Input('client_figures', 'data'),
+        Input('states_list', 'value'),
+        Input('ifr_movements', 'value'),
+        Input('period_selection', 'start_date'),
+        Input('period_selection', 'end_date'),
+        Input('seasonal_mode', 'value'),
+        Input('map_mode', 'value'),
+        Input('flights_mode', 'value')
+    )
+else:
+    app.callback(
+        Output('number_of_flights', 'figure'),
+        Output('seasonal_variability', 'figure'),
+        Output('div_top_5_nm_airports', 'children'),
+        Output('div_top_5_apt_airports', 'children'),
+        Output('map_summary', 'figure'),
+        Input('airports_list', 'value'),
+        Input('states_list', 'value'),
+        Input('ifr_movements', 'value'),
+        Input('period_selection', 'start_date'),
+        Input('period_selection', 'end_date'),
+        Input('seasonal_mode', 'value'),
+        Input('map_mode', 'value'),
+        Input('flights_mode', 'value')
+    )(update_dashboard)
+
+
+def get_warmup_calls():
+    """
+    Returns callback calls rendering the default view,
+    followed by the popular filters
+    """
+    snapshot = ds.get_snapshot()
+    start_date, end_date = warmup.get_default_period(snapshot)
+    filters = [{'airports': None, 'states': None}] + warmup.get_popular_filters(snapshot)
+    if config.CLIENTSIDE_MODE:
+        return [('get_state_document', client.get_state_document, ())] + [
+            (
+                'update_airports_tables', update_airports_tables,
+                (x['states'], start_date, end_date)
+            ) for x in filters
+        ]
+    return [
+        (
+            'update_dashboard', update_dashboard,
+            (
+                x['airports'], x['states'], warmup.ALL_MOVEMENTS,
+                start_date, end_date, c.SEASONAL_MODE_COMBINED, c.MAP_MODE_PERIOD,
+                c.FLIGHTS_MODE_TOTAL
+            )
+        ) for x in filters
+    ]
 
-    fig_map_summary.update_geos(fitbounds="locations", visible=False)
-    fig_map_summary.update_layout(margin={"r": 0, "t": 20, "l": 0, "b": 30})
 
-    return fig_map_summary
+if config.WARMUP and not config.FAST_START:
+    warmup.run(get_warmup_calls())
 
+startup_duration = time.perf_counter() - start_time
+# Dash writes the records of the logger of the app to stdout as well
+logging.getLogger('startup').log(
+    logging.WARNING if startup_duration > config.STARTUP_BUDGET_SECONDS else logging.INFO,
+    'App loaded in %.3f s (budget %d s)', startup_duration, config.STARTUP_BUDGET_SECONDS
+)
 
 if __name__ == '__main__':
     app.run_server(debug=True)
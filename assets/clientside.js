@@ -0,0 +1,473 @@
+/*
+ * Clientside callbacks of the client-side mode (CLIENTSIDE_MODE=1).
+ * Figures are computed from the per day aggregates served by client.py
+ * the same way data.py and series.py compute them on the server.
+ */
+(function () {
+    var DAY = 86400000;
+
+    function decode(value, type) {
+        var binary = atob(value);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new type(bytes.buffer);
+    }
+
+    // Decoded arrays of the aggregates objects, which are replaced on reload or new selection
+    var decoded = new WeakMap();
+
+    // Requests of the aggregates by URL. Clientside callbacks cannot wait for a
+    // promise, load_aggregates is called by an interval until the response is in
+    var loads = {};
+
+    function loadAggregates(url) {
+        var load = loads[url] = {};
+        fetch(url, {credentials: 'same-origin'}).then(function (response) {
+            if (!response.ok) {
+                throw new Error('Loading ' + url + ' failed with status ' + response.status);
+            }
+            return response.json();
+        }).then(function (aggregates) {
+            load.aggregates = aggregates;
+        }, function (error) {
+            console.error(error);
+            delete loads[url];
+        });
+        return load;
+    }
+
+    function getArrays(aggregates) {
+        if (!decoded.has(aggregates)) {
+            var arrays = {sums: {}, counts: {}};
+            Object.keys(aggregates.sums).forEach(function (column) {
+                arrays.sums[column] = decode(aggregates.sums[column], Float32Array);
+            });
+            Object.keys(aggregates.counts).forEach(function (column) {
+                arrays.counts[column] = decode(aggregates.counts[column], Int32Array);
+            });
+            decoded.set(aggregates, arrays);
+        }
+        return decoded.get(aggregates);
+    }
+
+    function parseDate(value) {
+        var iso = /^(\d{4})-(\d{2})-(\d{2})/.exec(value);
+        if (iso) {
+            return Date.UTC(+iso[1], iso[2] - 1, +iso[3]);
+        }
+        var us = /^(\d{1,2})\/(\d{1,2})\/(\d{4})/.exec(value);
+        return Date.UTC(+us[3], us[1] - 1, +us[2]);
+    }
+
+    function formatDate(time) {
+        return new Date(time).toISOString().slice(0, 10);
+    }
+
+    function formatDay(time) {
+        var parts = formatDate(time).split('-');
+        return parts[2] + '/' + parts[1] + '/' + parts[0];
+    }
+
+    function previousYear(time) {
+        // Same day one year earlier, the last day of the month if it does not exist
+        var date = new Date(time);
+        var shifted = Date.UTC(date.getUTCFullYear() - 1, date.getUTCMonth(), date.getUTCDate());
+        if (new Date(shifted).getUTCMonth() !== date.getUTCMonth()) {
+            shifted = Date.UTC(date.getUTCFullYear() - 1, date.getUTCMonth() + 1, 0);
+        }
+        return shifted;
+    }
+
+    function dayRange(aggregates, start, end) {
+        // Day bounds [start, stop) of the dates between start and end (both inclusive)
+        var first = parseDate(aggregates.first_date);
+        var startDay = Math.max(0, Math.ceil((start - first) / DAY));
+        var stopDay = Math.min(aggregates.days, Math.floor((end - first) / DAY) + 1);
+        return [startDay, Math.max(startDay, stopDay)];
+    }
+
+    function groupMask(aggregates, selected) {
+        return aggregates.groups.map(function (group) {
+            return !selected || selected.length === 0 || selected.indexOf(group) >= 0;
+        });
+    }
+
+    function dailyValues(aggregates, values, mask, start, stop) {
+        // Per day sums of the masked groups
+        var groups = aggregates.groups.length;
+        var result = new Float64Array(stop - start);
+        for (var day = start; day < stop; day++) {
+            var total = 0;
+            for (var group = 0; group < groups; group++) {
+                if (mask[group]) {
+                    total += values[day * groups + group];
+                }
+            }
+            result[day - start] = total;
+        }
+        return result;
+    }
+
+    function smoothingWindow(length, size, order) {
+        size = Math.min(size, length);
+        if (size % 2 === 0) {
+            size -= 1;
+        }
+        return size <= order ? null : size;
+    }
+
+    function fitCoefficients(size, order, position) {
+        // Coefficients evaluating at position the least squares polynomial of the window
+        var terms = order + 1;
+        var matrix = [];
+        for (var row = 0; row < terms; row++) {
+            matrix.push([]);
+            for (var column = 0; column <= terms; column++) {
+                var total = 0;
+                if (column < terms) {
+                    for (var k = 0; k < size; k++) {
+                        total += Math.pow(k - position, row + column);
+                    }
+                } else {
+                    total = row === 0 ? 1 : 0;
+                }
+                matrix[row].push(total);
+            }
+        }
+        for (var pivot = 0; pivot < terms; pivot++) {
+            var best = pivot;
+            for (row = pivot + 1; row < terms; row++) {
+                if (Math.abs(matrix[row][pivot]) > Math.abs(matrix[best][pivot])) {
+                    best = row;
+                }
+            }
+            var swap = matrix[pivot];
+            matrix[pivot] = matrix[best];
+            matrix[best] = swap;
+            for (row = 0; row < terms; row++) {
+                if (row !== pivot) {
+                    var factor = matrix[row][pivot] / matrix[pivot][pivot];
+                    for (column = pivot; column <= terms; column++) {
+                        matrix[row][column] -= factor * matrix[pivot][column];
+                    }
+                }
+            }
+        }
+        var solution = matrix.map(function (values, index) {
+            return values[terms] / values[index];
+        });
+        var coefficients = new Float64Array(size);
+        for (k = 0; k < size; k++) {
+            for (var power = 0; power < terms; power++) {
+                coefficients[k] += solution[power] * Math.pow(k - position, power);
+            }
+        }
+        return coefficients;
+    }
+
+    function smooth(values, size, order) {
+        // Savitzky-Golay filter with polynomial fits at the edges, as scipy does by default
+        size = smoothingWindow(values.length, size, order);
+        if (size === null) {
+            return values;
+        }
+        var half = (size - 1) / 2;
+        var length = values.length;
+        var result = new Float64Array(length);
+        var dot = function (coefficients, offset) {
+            var total = 0;
+            for (var k = 0; k < size; k++) {
+                total += coefficients[k] * values[offset + k];
+            }
+            return total;
+        };
+        var center = fitCoefficients(size, order, half);
+        for (var i = half; i < length - half; i++) {
+            result[i] = dot(center, i - half);
+        }
+        for (var position = 0; position < half; position++) {
+            result[position] = dot(fitCoefficients(size, order, position), 0);
+            result[length - 1 - position] = dot(
+                fitCoefficients(size, order, size - 1 - position), length - size
+            );
+        }
+        return result;
+    }
+
+    function flightsFigure(aggregates, settings, layout, columns, mask, start, stop) {
+        var arrays = getArrays(aggregates);
+        var counts = dailyValues(
+            aggregates, arrays.counts[aggregates.count_columns[columns[0]]], mask, start, stop
+        );
+        var first = parseDate(aggregates.first_date);
+        var days = [];
+        for (var day = 0; day < counts.length; day++) {
+            if (counts[day] > 0) {
+                days.push(day);
+            }
+        }
+        var x = days.map(function (day) {
+            return formatDate(first + (start + day) * DAY);
+        });
+        var names = ['Number of flights (recorded by NM)', 'Number of flights (recorded by airports)'];
+        var data = columns.map(function (column, index) {
+            var values = dailyValues(aggregates, arrays.sums[column], mask, start, stop);
+            var y = Float64Array.from(days, function (day) { return values[day]; });
+            var smoothing = settings.smoothing;
+            return {
+                type: 'scatter', mode: 'lines', name: names[index],
+                x: x, y: smooth(y, smoothing.window, smoothing.order)
+            };
+        });
+        return {data: data, layout: layout};
+    }
+
+    function fillGaps(values) {
+        // Linear interpolation of missing values, the nearest value before the first and after the last one
+        var known = [];
+        values.forEach(function (value, index) {
+            if (value !== null) {
+                known.push(index);
+            }
+        });
+        var next = 0;
+        return Float64Array.from(values, function (value, index) {
+            if (value !== null) {
+                next += 1;
+                return value;
+            }
+            var before = known[next - 1];
+            var after = known[next];
+            if (before === undefined) {
+                return values[after];
+            }
+            if (after === undefined) {
+                return values[before];
+            }
+            return values[before] + (values[after] - values[before]) * (index - before) / (after - before);
+        });
+    }
+
+    function comparisonFigure(aggregates, settings, layout, legend, column, mask, start, stop) {
+        // One line per masked group over the days any of them has rows, as series.py draws it
+        var arrays = getArrays(aggregates);
+        var groups = aggregates.groups.length;
+        var sums = arrays.sums[column];
+        var counts = arrays.counts[aggregates.count_columns[column]];
+        var first = parseDate(aggregates.first_date);
+        var selected = aggregates.groups.map(function (name, group) {
+            return group;
+        }).filter(function (group) {
+            return mask[group];
+        });
+        var days = [];
+        for (var day = start; day < stop; day++) {
+            if (selected.some(function (group) { return counts[day * groups + group] > 0; })) {
+                days.push(day);
+            }
+        }
+        var x = days.map(function (day) {
+            return formatDate(first + day * DAY);
+        });
+        var data = [];
+        selected.forEach(function (group) {
+            var y = days.map(function (day) {
+                return counts[day * groups + group] > 0 ? sums[day * groups + group] : null;
+            });
+            if (y.every(function (value) { return value === null; })) {
+                return;
+            }
+            var smoothed = smooth(fillGaps(y), settings.smoothing.window, settings.smoothing.order);
+            data.push({
+                type: 'scatter', mode: 'lines', name: aggregates.groups[group], x: x,
+                y: y.map(function (value, index) {
+                    return value === null ? null : smoothed[index];
+                })
+            });
+        });
+        return {data: data, layout: Object.assign({}, layout, {legend: legend})};
+    }
+
+    function monthlyAverages(aggregates, settings, columns, mask, start, stop, byYear) {
+        // Daily average flights of every month, months of all years combined unless byYear
+        var arrays = getArrays(aggregates);
+        var first = parseDate(aggregates.first_date);
+        var rows = dailyValues(aggregates, arrays.counts[aggregates.count_columns[columns[0]]], mask, start, stop);
+        var sums = columns.map(function (column) {
+            return dailyValues(aggregates, arrays.sums[column], mask, start, stop);
+        });
+        var counts = columns.map(function (column) {
+            return dailyValues(aggregates, arrays.counts[aggregates.count_columns[column]], mask, start, stop);
+        });
+        var months = {};
+        var keys = [];
+        for (var day = 0; day < rows.length; day++) {
+            var date = new Date(first + (start + day) * DAY);
+            var year = date.getUTCFullYear();
+            var month = date.getUTCMonth() + 1;
+            var key = byYear ? year * 100 + month : month;
+            if (!months[key]) {
+                months[key] = {year: year, month: month, rows: 0, sums: [0, 0], counts: [0, 0]};
+                keys.push(key);
+            }
+            months[key].rows += rows[day];
+            for (var index = 0; index < columns.length; index++) {
+                months[key].sums[index] += sums[index][day];
+                months[key].counts[index] += counts[index][day];
+            }
+        }
+        keys.sort(function (a, b) { return a - b; });
+        return keys.map(function (key) { return months[key]; }).filter(function (month) {
+            return month.rows > 0;
+        }).map(function (month) {
+            month.values = month.sums.map(function (total, index) {
+                return month.counts[index] > 0 ? total / month.counts[index] : null;
+            });
+            month.name = settings.month_names[month.month - 1];
+            return month;
+        });
+    }
+
+    function seasonalFigure(aggregates, settings, layout, columns, mask, startDate, endDate, mode) {
+        var bounds = dayRange(aggregates, startDate, endDate);
+        var sources = ['recorded by NM', 'recorded by airports'];
+        var data = [];
+        if (mode === 'years') {
+            var byYear = {};
+            var years = [];
+            monthlyAverages(aggregates, settings, columns, mask, bounds[0], bounds[1], true).forEach(function (month) {
+                if (!byYear[month.year]) {
+                    byYear[month.year] = {x: [], y: []};
+                    years.push(month.year);
+                }
+                byYear[month.year].x.push(month.name);
+                byYear[month.year].y.push(month.values[0]);
+            });
+            data = years.map(function (year) {
+                return {
+                    type: 'scatter', mode: 'lines+markers', name: year + ' (recorded by NM)',
+                    x: byYear[year].x, y: byYear[year].y
+                };
+            });
+        } else if (mode === 'previous') {
+            var months = monthlyAverages(aggregates, settings, columns, mask, bounds[0], bounds[1], true);
+            var previousBounds = dayRange(aggregates, previousYear(startDate), previousYear(endDate));
+            var previous = {};
+            monthlyAverages(aggregates, settings, columns, mask, previousBounds[0], previousBounds[1], true).forEach(function (month) {
+                previous[(month.year + 1) * 100 + month.month] = month;
+            });
+            var x = months.map(function (month) { return month.name + ' ' + month.year; });
+            sources.forEach(function (source, index) {
+                data.push({
+                    type: 'scatter', mode: 'lines+markers', name: 'Selected period (' + source + ')',
+                    x: x, y: months.map(function (month) { return month.values[index]; })
+                });
+                data.push({
+                    type: 'scatter', mode: 'lines+markers', name: 'Previous year (' + source + ')',
+                    x: x, y: months.map(function (month) {
+                        var match = previous[month.year * 100 + month.month];
+                        return match ? match.values[index] : null;
+                    })
+                });
+            });
+        } else {
+            var combined = monthlyAverages(aggregates, settings, columns, mask, bounds[0], bounds[1], false);
+            data = sources.map(function (source, index) {
+                return {
+                    type: 'scatter', mode: 'lines+markers',
+                    name: 'Daily average number of flights (' + source + ')',
+                    x: combined.map(function (month) { return month.name; }),
+                    y: combined.map(function (month) { return month.values[index]; })
+                };
+            });
+        }
+        return {data: data, layout: layout};
+    }
+
+    function mapFigure(aggregates, skeleton, column, startDate, endDate, mode) {
+        var arrays = getArrays(aggregates);
+        var groups = aggregates.groups.length;
+        var sums = arrays.sums[column];
+        var counts = arrays.counts[aggregates.count_columns[column]];
+        var title;
+        var start, stop;
+        if (mode === 'day') {
+            var day = dayRange(aggregates, endDate, endDate);
+            start = day[0];
+            stop = day[1];
+            title = 'Number of flights<br>on ' + formatDay(endDate);
+        } else {
+            var bounds = dayRange(aggregates, startDate, endDate);
+            start = bounds[0];
+            stop = bounds[1];
+            title = 'Daily average flights<br>' + formatDay(startDate) + ' - ' + formatDay(endDate);
+        }
+        var totals = new Float64Array(groups);
+        var rows = new Float64Array(groups);
+        var days = 0;
+        for (var index = start; index < stop; index++) {
+            var dayRows = 0;
+            for (var group = 0; group < groups; group++) {
+                totals[group] += sums[index * groups + group];
+                rows[group] += counts[index * groups + group];
+                dayRows += counts[index * groups + group];
+            }
+            if (dayRows > 0) {
+                days += 1;
+            }
+        }
+        var locations = [];
+        var values = [];
+        for (group = 0; group < groups; group++) {
+            if (rows[group] > 0) {
+                locations.push(aggregates.groups[group]);
+                values.push(mode === 'day' || days === 0 ? totals[group] : totals[group] / days);
+            }
+        }
+        var trace = Object.assign({}, skeleton.data[0], {
+            locations: locations,
+            z: values,
+            zmax: values.length ? Math.max.apply(null, values) : 1,
+            colorbar: {title: {text: title}}
+        });
+        return {data: [trace], layout: skeleton.layout};
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dashboard: {
+            load_aggregates: function (intervals, url) {
+                var load = loads[url] || loadAggregates(url);
+                if (!load.aggregates) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                delete loads[url];
+                return [load.aggregates, true];
+            },
+            update_figures: function (aggregates, selection, figures, states, movements,
+                                      startDate, endDate, seasonalMode, mapMode, flightsMode) {
+                if (!aggregates) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                var key = movements && movements.length === 1 ? movements[0] : '';
+                var columns = aggregates.flight_columns[key];
+                var start = parseDate(startDate);
+                var end = parseDate(endDate);
+                var source = selection || aggregates;
+                var mask = groupMask(source, selection ? null : states);
+                var bounds = dayRange(source, start, end);
+                var layouts = figures.layouts;
+                var flights = flightsMode === 'compare' ? comparisonFigure(
+                    source, aggregates, layouts.number_of_flights, layouts.comparison_legend,
+                    columns[0], mask, bounds[0], bounds[1]
+                ) : flightsFigure(source, aggregates, layouts.number_of_flights, columns, mask, bounds[0], bounds[1]);
+                return [
+                    flights,
+                    seasonalFigure(source, aggregates, figures.layouts.seasonal_variability, columns, mask, start, end, seasonalMode),
+                    mapFigure(aggregates, figures.map, columns[0], start, end, mapMode)
+                ];
+            }
+        }
+    });
+})();
@@ -0,0 +1,284 @@
+"""
+Query backends of the row level data functions.
+
+The dashboard figures are answered from the traffic cube, rows are only
+read by exports. A backend filters them for a snapshot:
+
+    pandas  the dataset of the snapshot, in memory or in yearly partitions
+    duckdb  an embedded DuckDB engine over Parquet files of the snapshot,
+            date, state and airport filters are pushed down into the scan
+
+QUERY_BACKEND selects the backend of exports. The backends also answer
+the row level get_* aggregations of data.py, which the dashboard no
+longer uses, for benchmarks/backend_parity.py to check that both return
+the same rows and values. The duckdb package is optional, it is only
+imported when that backend is used.
+
+DuckDB only saves memory together with LAZY_PARTITIONS: its Parquet files
+are then converted from the yearly partitions one at a time and exports
+do not read years into the partition cache. Without it, rows are kept in
+memory for the snapshot anyway.
+"""
+import functools
+import logging
+import os
+import shutil
+import threading
+import time
+import pandas as pd
+import config
+import constants as c
+import data as ds
+from caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PREVIOUS_VERSIONS_KEPT = 1
+
+
+class PandasBackend:
+    """
+    Queries the dataset of the snapshot with pandas
+    """
+    name = 'pandas'
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def filter_dataset(self, airports=None, states=None, start_date=None, end_date=None):
+        return ds.filter_dataset(self.snapshot.data, airports, states, start_date, end_date)
+
+    def iter_filtered_dataset(self, airports=None, states=None, start_date=None,
+                              end_date=None, days=c.EXPORT_CHUNK_DAYS):
+        """
+        Yields the filtered dataset in slices of at most days days
+        """
+        return ds.iter_filtered_dataset(
+            self.snapshot.data, airports, states, start_date, end_date,
+            days, filter_rows=self.filter_dataset
+        )
+
+    def number_of_flights(self, flight_columns, **filters):
+        return ds.get_number_of_flights(self.filter_dataset(**filters), flight_columns)
+
+    def top_flight_airports(self, source='NM', **filters):
+        return ds.get_top_flight_airports(self.filter_dataset(**filters), source)
+
+    def daily_average_per_state(self, flight_columns, **filters):
+        return ds.get_daily_average_per_state(self.filter_dataset(**filters), flight_columns)
+
+    def average_per_month(self, flight_columns, **filters):
+        return ds.get_average_per_month(self.filter_dataset(**filters), flight_columns)
+
+
+class DuckDBBackend(PandasBackend):
+    """
+    Queries Parquet files of the snapshot with DuckDB. Files are written
+    once per dataset version, one per year in the order of the dataset
+    with row groups of about a week, so that date filters skip row groups.
+    """
+    name = 'duckdb'
+
+    def __init__(self, snapshot, directory=c.DATASET_PARQUET_DIR):
+        super().__init__(snapshot)
+        self.directory = os.path.join(directory, snapshot.version)
+        self.files = write_parquet_files(snapshot, self.directory)
+        self.local = threading.local()
+
+    def get_connection(self):
+        """
+        Returns the DuckDB connection of the current thread
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            import duckdb
+
+            connection = self.local.connection = duckdb.connect()
+        return connection
+
+    def query(self, select, filters, group_by=None, having=None, order_by=None,
+              limit=None):
+        """
+        Runs the query over the filtered rows and returns a dataframe
+        """
+        conditions, parameters = get_conditions(**filters)
+        sql = 'SELECT {} FROM read_parquet(?) WHERE {}'.format(
+            select, ' AND '.join(conditions)
+        )
+        for clause, value in [('GROUP BY', group_by), ('HAVING', having),
+                              ('ORDER BY', order_by), ('LIMIT', limit)]:
+            if value is not None:
+                sql += ' {} {}'.format(clause, value)
+        return self.get_connection().execute(sql, [self.files] + parameters).df()
+
+    def filter_dataset(self, airports=None, states=None, start_date=None, end_date=None):
+        result = self.query(', '.join(quote(x) for x in ds.DATASET_COLUMNS), {
+            'airports': airports, 'states': states,
+            'start_date': start_date, 'end_date': end_date
+        })
+        return ds.index_by_date(ds.compact_dataset(result))
+
+    def number_of_flights(self, flight_columns, **filters):
+        return self.query(
+            '{}, {}'.format(quote(c.DATE), get_sums(flight_columns)),
+            filters, group_by=quote(c.DATE), order_by=quote(c.DATE)
+        )
+
+    def top_flight_airports(self, source='NM', **filters):
+        column = c.AIRPORT_TOTAL_FLIGHTS if source == 'APT' else c.NM_TOTAL_FLIGHTS
+        return self.query(
+            '{}, avg({}) AS {}'.format(
+                quote(c.AIRPORT_NAME), quote(column), quote(c.DAILY_AVERAGE)
+            ),
+            filters,
+            group_by=quote(c.AIRPORT_NAME),
+            having='count({}) > 0'.format(quote(column)),
+            order_by='{} DESC, {}'.format(quote(c.DAILY_AVERAGE), quote(c.AIRPORT_NAME)),
+            limit=5
+        )
+
+    def daily_average_per_state(self, flight_columns, **filters):
+        return self.query(
+            '{}, {}'.format(quote(c.STATE_NAME), get_sums(flight_columns)),
+            filters, group_by=quote(c.STATE_NAME), order_by=quote(c.STATE_NAME)
+        )
+
+    def average_per_month(self, flight_columns, **filters):
+        return self.query(
+            '{}, {}, {}'.format(
+                quote(c.MONTH_MON), quote(c.MONTH_NUM),
+                ', '.join('avg({0}) AS {0}'.format(quote(x)) for x in flight_columns)
+            ),
+            filters,
+            group_by='{}, {}'.format(quote(c.MONTH_MON), quote(c.MONTH_NUM)),
+            order_by=quote(c.MONTH_NUM)
+        )
+
+
+BACKENDS = {
+    PandasBackend.name: PandasBackend,
+    DuckDBBackend.name: DuckDBBackend,
+}
+
+
+def quote(name):
+    return '"{}"'.format(name)
+
+
+def get_sums(flight_columns):
+    """
+    Sums of the columns, 0 when no value is reported as pandas does
+    """
+    return ', '.join(
+        'coalesce(sum({0}), 0) AS {0}'.format(quote(x)) for x in flight_columns
+    )
+
+
+def get_conditions(airports=None, states=None, start_date=None, end_date=None):
+    """
+    Returns SQL conditions and parameters of the filters of filter_dataset
+    """
+    conditions = ['TRUE']
+    parameters = []
+    if start_date is not None:
+        conditions.append('{} >= ?'.format(quote(c.DATE)))
+        parameters.append(pd.to_datetime(start_date).to_pydatetime())
+    if end_date is not None:
+        conditions.append('{} <= ?'.format(quote(c.DATE)))
+        parameters.append(pd.to_datetime(end_date).to_pydatetime())
+    for column, values in [(c.AIRPORT_NAME, airports), (c.STATE_NAME, states)]:
+        if values:
+            conditions.append('{} IN ({})'.format(
+                quote(column), ', '.join('?' for _ in values)
+            ))
+            parameters.extend(values)
+    return conditions, parameters
+
+
+def get_parquet_parts(data):
+    """
+    Returns names and readers of the rows of every Parquet file, one per
+    year. Partitioned datasets read each year from its partition without
+    caching it. Rows ingested later are in a file of their own.
+    """
+    if isinstance(data, ds.PartitionedDataset):
+        parts = [
+            (str(year), functools.partial(data.read_partition, year))
+            for year in data.years
+        ]
+    else:
+        rows = data.data if isinstance(data, ds.AppendedDataset) else data
+        first_date, last_date = ds.get_date_bounds(rows)
+        parts = [
+            (str(year), functools.partial(
+                ds.filter_dataset_by_date, rows,
+                '{}-01-01'.format(year), '{}-12-31'.format(year)
+            ))
+            for year in range(first_date.year, last_date.year + 1)
+        ]
+    appended_rows = getattr(data, 'appended_rows', None)
+    if appended_rows is not None:
+        parts.append(('appended', lambda: appended_rows))
+    return parts
+
+
+def remove_old_versions(parent, version, kept_versions=PREVIOUS_VERSIONS_KEPT):
+    """
+    Removes the Parquet files of dataset versions other than the given
+    one, except the most recently written ones: workers that have not
+    swapped their snapshot yet may still be querying them
+    """
+    others = sorted(
+        (os.path.join(parent, x) for x in os.listdir(parent) if x != version),
+        key=os.path.getmtime, reverse=True
+    )
+    for path in others[kept_versions:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def write_parquet_files(snapshot, directory):
+    """
+    Writes the dataset of the snapshot as one Parquet file per year,
+    unless a previous process did, and returns their paths. Files of
+    versions older than the previous one are removed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parts = get_parquet_parts(snapshot.data)
+    paths = [os.path.join(directory, '{}.parquet'.format(x)) for x, _ in parts]
+    if all(os.path.exists(x) for x in paths):
+        return paths
+
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    for (_, read_rows), path in zip(parts, paths):
+        rows = read_rows()[ds.DATASET_COLUMNS]
+        days = max(rows[c.DATE].nunique(), 1)
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        pq.write_table(
+            pa.Table.from_pandas(rows, preserve_index=False), temporary_path,
+            row_group_size=max(len(rows) * 7 // days, 1)
+        )
+        os.replace(temporary_path, path)
+    remove_old_versions(os.path.dirname(directory), snapshot.version)
+    logger.info(
+        'Wrote %d Parquet files to %s in %.3f s',
+        len(paths), directory, time.perf_counter() - start
+    )
+    return paths
+
+
+backend_cache = LRUCache(2, 'backends')
+
+
+def get_backend(name=config.QUERY_BACKEND):
+    """
+    Returns the backend of the current snapshot
+    """
+    if name not in BACKENDS:
+        raise ValueError('QUERY_BACKEND must be one of {}'.format(', '.join(BACKENDS)))
+    snapshot = ds.get_snapshot()
+    return backend_cache.get_or_compute(
+        (name, snapshot.version), lambda: BACKENDS[name](snapshot)
+    )
@@ -0,0 +1,125 @@
+"""
+Parity check of the query backends.
+
+    python -m benchmarks.backend_parity --scale 1
+
+Runs every query of the backends on a synthetic dataset (or the loaded
+one with --loaded) for several filter shapes and compares the results
+of each backend with the pandas one: same columns, same rows in the
+same order, names equal and numbers equal up to float32 precision, the
+type of the stored counters. Empty results only need to be empty.
+Exits with status 1 on any difference.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('PRELOAD_DATASET', '0')
+
+import pandas as pd
+import backends
+import data as ds
+from benchmarks.bench_data import FLIGHT_COLUMNS, get_filter_shapes
+from benchmarks.synthetic import generate_dataset
+
+RELATIVE_TOLERANCE = 1e-6
+
+
+def get_queries(snapshot):
+    """
+    Returns filter shapes of the benchmarks with combined and empty filters
+    """
+    shapes = get_filter_shapes(snapshot)
+    cube = snapshot.cube
+    shapes['airport_and_state'] = {
+        'airports': list(cube.airports[:3]),
+        'states': [cube.airport_states[cube.airports[0]]]
+    }
+    shapes['no_rows'] = {'states': ['Unknown']}
+    return shapes
+
+
+def run_queries(backend, filters):
+    return {
+        'filter_dataset': backend.filter_dataset(**filters),
+        'number_of_flights': backend.number_of_flights(FLIGHT_COLUMNS, **filters),
+        'top_flight_airports_nm': backend.top_flight_airports('NM', **filters),
+        'top_flight_airports_apt': backend.top_flight_airports('APT', **filters),
+        'daily_average_per_state': backend.daily_average_per_state(FLIGHT_COLUMNS, **filters),
+        'average_per_month': backend.average_per_month(FLIGHT_COLUMNS, **filters),
+    }
+
+
+def normalize(frame):
+    """
+    Returns the values of the frame with names as strings and numbers as floats
+    """
+    frame = frame.reset_index(drop=True)
+    for column in frame.columns:
+        if pd.api.types.is_numeric_dtype(frame[column]):
+            frame[column] = frame[column].astype('float64')
+        elif not pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].astype(str)
+    return frame
+
+
+def compare(expected, result):
+    """
+    Returns the difference between two results, None when they match.
+    pivot_table drops the value columns of empty results, so
+    empty results only need to be empty on both sides.
+    """
+    if expected.empty and result.empty:
+        return None
+    try:
+        pd.testing.assert_frame_equal(
+            normalize(expected), normalize(result),
+            check_dtype=False, rtol=RELATIVE_TOLERANCE
+        )
+    except AssertionError as error:
+        return str(error)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--loaded', action='store_true', help='use the loaded dataset')
+    parser.add_argument('--backends', nargs='+', default=['duckdb'])
+    arguments = parser.parse_args()
+
+    if arguments.loaded:
+        snapshot = ds.get_snapshot()
+    else:
+        snapshot = ds.DatasetSnapshot(
+            generate_dataset(arguments.scale), 'synthetic-{}'.format(arguments.scale)
+        )
+        ds.swap_snapshot(snapshot)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        reference = backends.PandasBackend(snapshot)
+        for name in arguments.backends:
+            if name == backends.DuckDBBackend.name:
+                backend = backends.DuckDBBackend(snapshot, directory)
+            else:
+                backend = backends.BACKENDS[name](snapshot)
+            for shape, filters in get_queries(snapshot).items():
+                expected = run_queries(reference, filters)
+                for query, result in run_queries(backend, filters).items():
+                    difference = compare(expected[query], result)
+                    print('  {:<8} {:<18} {:<26} {}'.format(
+                        name, shape, query, 'ok' if difference is None else 'DIFFERENT'
+                    ))
+                    if difference is not None:
+                        print(difference)
+                        failures += 1
+    if failures:
+        print('{} results differ'.format(failures))
+        sys.exit(1)
+    print('All results match')
+
+
+if __name__ == '__main__':
+    main()
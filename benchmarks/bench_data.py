@@ -0,0 +1,188 @@
+"""
+Benchmarks of the data.py aggregation functions on synthetic datasets.
+
+    python -m benchmarks.bench_data --scales 1 10 100
+
+Results are stored as JSON in benchmarks/results, named after the
+current commit, and can be compared with benchmarks.compare.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+os.environ.setdefault('PRELOAD_DATASET', '0')
+
+import numpy as np
+import pandas as pd
+import config
+import constants as c
+import data as ds
+import pipeline
+import series
+from benchmarks.synthetic import generate_dataset
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+FLIGHT_COLUMNS = [c.NM_TOTAL_FLIGHTS, c.AIRPORT_TOTAL_FLIGHTS]
+
+
+def get_filter_shapes(snapshot):
+    """
+    Returns representative filters of dashboard requests
+    """
+    last_date = snapshot.last_date
+    month_start = last_date.replace(day=1) - pd.DateOffset(months=1)
+    return {
+        'full_range': {},
+        'single_airport': {'airports': [snapshot.cube.airports[0]]},
+        'several_states': {'states': list(snapshot.cube.states[:5])},
+        'one_month': {
+            'start_date': month_start,
+            'end_date': month_start + pd.DateOffset(months=1, days=-1)
+        },
+        'states_one_year': {
+            'states': list(snapshot.cube.states[:5]),
+            'start_date': last_date - pd.DateOffset(years=1),
+            'end_date': last_date
+        }
+    }
+
+
+def get_benchmarks(snapshot, filters):
+    """
+    Returns functions to time for the filters, by name
+    """
+    filtered = ds.filter_dataset(snapshot.data, **filters)
+    return {
+        'filter_dataset': lambda: ds.filter_dataset(snapshot.data, **filters),
+        'get_number_of_flights': lambda: ds.get_number_of_flights(filtered, FLIGHT_COLUMNS),
+        'get_top_flight_airports': lambda: ds.get_top_flight_airports(filtered, 'NM'),
+        'get_daily_average_per_state': lambda: ds.get_daily_average_per_state(
+            filtered, FLIGHT_COLUMNS
+        ),
+        'get_average_per_month': lambda: ds.get_average_per_month(filtered, FLIGHT_COLUMNS),
+        'query_number_of_flights': lambda: ds.query_number_of_flights(
+            FLIGHT_COLUMNS, **filters
+        ),
+        'query_top_flight_airports': lambda: ds.query_top_flight_airports('NM', **filters),
+        'query_top_airports': lambda: ds.query_top_airports(**filters),
+        'query_monthly_averages': lambda: ds.query_monthly_averages(
+            FLIGHT_COLUMNS, by_year=False, **filters
+        ),
+        'query_daily_average_per_state': lambda: ds.query_daily_average_per_state(
+            FLIGHT_COLUMNS, **filters
+        ),
+        'query_flights_by_group': lambda: ds.query_flights_by_group(
+            c.NM_TOTAL_FLIGHTS, **filters
+        ),
+        'comparison_series': lambda: run_comparison(filters),
+        'dashboard_serial': lambda: run_dashboard(filters, 1),
+        'dashboard_pipeline': lambda: run_dashboard(filters, config.PIPELINE_THREADS),
+    }
+
+
+def run_dashboard(filters, threads):
+    """
+    Computes the aggregates of a dashboard update without memoized series
+    """
+    series.series_cache.clear()
+    return pipeline.run(
+        pipeline.get_dashboard_tasks(FLIGHT_COLUMNS, **filters), threads=threads
+    )
+
+
+def run_comparison(filters):
+    """
+    Computes the smoothed series of the compared entities without memoized series
+    """
+    series.series_cache.clear()
+    return series.get_comparison_chart_series(c.NM_TOTAL_FLIGHTS, **filters)
+
+
+def time_function(function, repeat):
+    """
+    Returns timings of repeated calls in milliseconds
+    """
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run(scales, repeat, selected=None):
+    """
+    Runs the benchmarks for every scale and returns the results
+    """
+    results = []
+    for scale in scales:
+        start = time.perf_counter()
+        data = generate_dataset(scale)
+        snapshot = ds.DatasetSnapshot(data, 'synthetic-{}'.format(scale))
+        ds.swap_snapshot(snapshot)
+        print('Scale {}: {} rows generated and aggregated in {:.1f} s'.format(
+            scale, len(data), time.perf_counter() - start
+        ))
+        for shape, filters in get_filter_shapes(snapshot).items():
+            for name, function in get_benchmarks(snapshot, filters).items():
+                if selected and name not in selected:
+                    continue
+                timings = time_function(function, repeat)
+                results.append({
+                    'scale': scale,
+                    'rows': len(data),
+                    'shape': shape,
+                    'function': name,
+                    'median_ms': float(np.median(timings)),
+                    'min_ms': float(np.min(timings)),
+                    'repeat': repeat
+                })
+                print('  {:<16} {:<30} {:10.2f} ms'.format(
+                    shape, name, results[-1]['median_ms']
+                ))
+    return results
+
+
+def get_commit():
+    """
+    Returns short hash of the current commit
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unversioned'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--functions', nargs='*', help='only run these functions')
+    parser.add_argument('--output', help='JSON file, by default named after the commit')
+    arguments = parser.parse_args()
+
+    commit = get_commit()
+    report = {
+        'commit': commit,
+        'date': pd.Timestamp.now().isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'results': run(arguments.scales, arguments.repeat, arguments.functions)
+    }
+    output = arguments.output or os.path.join(RESULTS_DIR, '{}.json'.format(commit))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print('Results stored in {}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Compares two benchmark result files.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+Exits with status 1 when a benchmark got slower than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    """
+    Returns median timings by (scale, shape, function)
+    """
+    with open(path) as file:
+        report = json.load(file)
+    return {
+        (x['scale'], x['shape'], x['function']): x['median_ms']
+        for x in report['results']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio reported as a regression')
+    arguments = parser.parse_args()
+
+    baseline = load_results(arguments.baseline)
+    candidate = load_results(arguments.candidate)
+    regressions = 0
+    for key in sorted(set(baseline) & set(candidate)):
+        ratio = candidate[key] / baseline[key] if baseline[key] else float('inf')
+        flag = ''
+        if ratio > arguments.threshold:
+            flag = 'REGRESSION'
+            regressions += 1
+        print('{:>4}x {:<16} {:<30} {:10.2f} {:10.2f} {:6.2f} {}'.format(
+            *key, baseline[key], candidate[key], ratio, flag
+        ))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Breakdown of the import time of the dashboard.
+
+    python -m benchmarks.import_time --fast-start --budget 10
+
+Imports app in a fresh interpreter with -X importtime and prints the
+modules taking the most cumulative time, the repository modules first.
+Exits with status 1 when the total exceeds the budget, so it can gate
+changes to the cold start of the workers.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_import_times(fast_start, working_dir):
+    """
+    Returns the list of (module, self us, cumulative us, depth) of an import of app
+    """
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY_DIR)
+    if fast_start:
+        environment['FAST_START'] = '1'
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=working_dir, env=environment, capture_output=True, text=True, check=True
+    )
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), int(self_time), int(cumulative), depth))
+    return times
+
+
+def is_repository_module(name):
+    return os.path.exists(os.path.join(REPOSITORY_DIR, name.split('.')[0] + '.py'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fast-start', action='store_true', help='import with FAST_START=1')
+    parser.add_argument('--budget', type=float, default=10, help='seconds')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--dir', default='.', help='directory with the dataset')
+    arguments = parser.parse_args()
+
+    times = get_import_times(arguments.fast_start, arguments.dir)
+    top_level = [x for x in times if x[3] == 0]
+    total = sum(x[2] for x in top_level) / 1e6
+    own = sorted(
+        [x for x in times if is_repository_module(x[0])], key=lambda x: -x[2]
+    )
+    print('Repository modules (cumulative, includes their dependencies):')
+    for name, _, cumulative, _ in own:
+        print('  {:<40} {:>8.3f} s'.format(name, cumulative / 1e6))
+    print('Imports of app:')
+    direct = [x for x in times if x[3] == 1]
+    for name, _, cumulative, _ in sorted(direct, key=lambda x: -x[2])[:arguments.top]:
+        print('  {:<40} {:>8.3f} s'.format(name, cumulative / 1e6))
+    print('Total {:.3f} s, budget {:.3f} s'.format(total, arguments.budget))
+    if total > arguments.budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
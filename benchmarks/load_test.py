@@ -0,0 +1,421 @@
+"""
+Load test of the dashboard callbacks with gunicorn.
+
+    python -m benchmarks.load_test --workers 1 2 4 --concurrency 8 --scenario scenario.jsonl
+
+For every worker count, starts gunicorn on app:server, replays the
+_dash-update-component payloads of the scenario at the given concurrency
+and reports latency percentiles of the successful requests, throughput
+and the RSS of the workers. The run fails when any request fails.
+
+The scenario is a file with one callback payload per line. When it does
+not exist, it is synthesized from the layout and callbacks served by the
+app: sessions loading the page and then changing the period, the states,
+the airports or the movements, each change firing the callbacks a browser
+would call. Sessions depend only on --seed, and the file is written so
+later runs replay the same requests. Real interactions are recorded by
+running the app with RECORD_CALLBACKS=scenario.jsonl.
+
+--synthetic-scale runs the app on a synthetic dataset (see
+benchmarks.synthetic) written to a temporary directory, so runs do not
+need the EUROCONTROL file. Results are stored as JSON in
+benchmarks/results, named after the current commit.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+import constants as c
+from benchmarks.bench_data import RESULTS_DIR, get_commit
+from benchmarks.synthetic import write_source_file
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CALLBACK_PATH = '/_dash-update-component'
+STARTUP_TIMEOUT = 300
+PERIOD_DAYS = [7, 30, 90, 365, None]
+INTERACTIONS = {
+    'period': 4,
+    'states': 3,
+    'airports': 2,
+    'movements': 1,
+}
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def post(url, payload):
+    """
+    Returns status and size of the response to a JSON request
+    """
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(),
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, len(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, 0
+
+
+def start_server(workers, port, directory, environment):
+    """
+    Starts gunicorn and waits until it serves the layout
+    """
+    log = open(os.path.join(directory, 'load_test_{}.log'.format(workers)), 'w')
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', 'app:server', '--preload',
+            '--workers', str(workers), '--bind', '127.0.0.1:{}'.format(port),
+            '--timeout', '120'
+        ],
+        cwd=directory, env=environment, stdout=log, stderr=subprocess.STDOUT
+    )
+    url = 'http://127.0.0.1:{}'.format(port)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited, see {}'.format(log.name))
+        try:
+            get(url + '/_dash-layout')
+            return process, url
+        except (OSError, ValueError):
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start in {} s'.format(STARTUP_TIMEOUT))
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def get_worker_rss(process):
+    """
+    Returns resident memory of the gunicorn workers in MiB (Linux only)
+    """
+    try:
+        with open('/proc/{0}/task/{0}/children'.format(process.pid)) as file:
+            pids = file.read().split()
+    except OSError:
+        return []
+    sizes = []
+    for pid in pids:
+        try:
+            with open('/proc/{}/status'.format(pid)) as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        sizes.append(int(line.split()[1]) / 1024)
+        except OSError:
+            pass
+    return sizes
+
+
+def get_component_props(layout):
+    """
+    Returns props of the components of the layout by id
+    """
+    components = {}
+    pending = [layout]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, dict) and 'props' in node:
+            props = node['props']
+            if 'id' in props:
+                components[props['id']] = props
+            pending.append(props.get('children'))
+    return components
+
+
+def split_prop(prop_id):
+    name, prop = prop_id.rsplit('.', 1)
+    return name, prop
+
+
+def parse_date(value):
+    for date_format in ['%m/%d/%Y', '%Y-%m-%d']:
+        try:
+            return datetime.strptime(value[:10], date_format)
+        except ValueError:
+            pass
+    raise ValueError('unknown date format {}'.format(value))
+
+
+class Session:
+    """
+    Values of the inputs of a page and the payloads of their changes
+    """
+    def __init__(self, components, dependencies):
+        self.components = components
+        self.dependencies = [x for x in dependencies if not x.get('clientside_function')]
+        self.values = {}
+        for dependency in self.dependencies:
+            for item in dependency['inputs'] + dependency['state']:
+                props = components.get(item['id'], {})
+                self.values[item['id'], item['property']] = props.get(item['property'])
+
+    def get_payload(self, dependency, changed):
+        def describe(items):
+            return [
+                dict(item, value=self.values[item['id'], item['property']])
+                for item in items
+            ]
+
+        return {
+            'output': dependency['output'],
+            'inputs': describe(dependency['inputs']),
+            'state': describe(dependency['state']),
+            'changedPropIds': ['{}.{}'.format(*x) for x in changed]
+        }
+
+    def load(self):
+        """
+        Returns payloads of the callbacks fired when the page loads
+        """
+        return [self.get_payload(x, []) for x in self.dependencies]
+
+    def change(self, updates):
+        """
+        Sets input values and returns payloads of the callbacks they fire
+        """
+        self.values.update(updates)
+        return [
+            self.get_payload(x, list(updates))
+            for x in self.dependencies
+            if any((item['id'], item['property']) in updates for item in x['inputs'])
+        ]
+
+    def get_options(self, name):
+        return [x['value'] for x in self.components[name].get('options') or []]
+
+    def interact(self, rng):
+        """
+        Returns payloads of a random change of the filters
+        """
+        kind = rng.choices(list(INTERACTIONS), weights=list(INTERACTIONS.values()))[0]
+        if kind == 'period':
+            props = self.components['period_selection']
+            first = parse_date(props['min_date_allowed'])
+            last = parse_date(props['max_date_allowed']) - timedelta(days=1)
+            days = rng.choice(PERIOD_DAYS)
+            if days is None or days > (last - first).days:
+                start, end = first, last
+            else:
+                start = first + timedelta(days=rng.randrange((last - first).days - days + 1))
+                end = start + timedelta(days=days - 1)
+            return self.change({
+                ('period_selection', 'start_date'): start.strftime('%Y-%m-%d'),
+                ('period_selection', 'end_date'): end.strftime('%Y-%m-%d')
+            })
+        if kind == 'states':
+            options = self.get_options('states_list')
+            value = rng.sample(options, rng.randint(0, min(3, len(options))))
+            return self.change({('states_list', 'value'): value or None})
+        if kind == 'airports':
+            options = self.get_options('airports_list')
+            value = rng.sample(options, rng.randint(0, min(2, len(options))))
+            return self.change({('airports_list', 'value'): value or None})
+        options = self.get_options('ifr_movements')
+        value = [x for x in options if rng.random() < 0.5]
+        return self.change({('ifr_movements', 'value'): value})
+
+
+def synthesize_scenario(url, sessions, interactions, seed):
+    """
+    Returns payloads of sessions loading the page and changing its filters
+    """
+    components = get_component_props(get(url + '/_dash-layout'))
+    dependencies = get(url + '/_dash-dependencies')
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(sessions):
+        session = Session(components, dependencies)
+        payloads.extend(session.load())
+        for _ in range(interactions):
+            payloads.extend(session.interact(rng))
+    return payloads
+
+
+def read_scenario(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_scenario(path, payloads):
+    with open(path, 'w') as file:
+        for payload in payloads:
+            file.write(json.dumps(payload, separators=(',', ':')) + '\n')
+
+
+def replay(url, payloads, concurrency, number):
+    """
+    Sends number payloads, cycling through the scenario, from concurrency
+    threads and returns latencies in ms of the successful requests,
+    statuses of the failed ones and duration
+    """
+    latencies = []
+    errors = []
+    requests = itertools.islice(itertools.cycle(payloads), number)
+    lock = threading.Lock()
+
+    def send():
+        while True:
+            with lock:
+                payload = next(requests, None)
+            if payload is None:
+                return
+            start = time.perf_counter()
+            status, _ = post(url + CALLBACK_PATH, payload)
+            latency = (time.perf_counter() - start) * 1000
+            with lock:
+                if 200 <= status < 300:
+                    latencies.append(latency)
+                else:
+                    errors.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(send) for _ in range(concurrency)]:
+            future.result()
+    return latencies, errors, time.perf_counter() - start
+
+
+def get_percentile(latencies, percentile):
+    """
+    Returns the percentile of the latencies, NaN without any
+    """
+    if not latencies:
+        return float('nan')
+    return float(np.percentile(latencies, percentile))
+
+
+def get_environment(settings):
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY_DIR)
+    environment.update(x.split('=', 1) for x in settings)
+    return environment
+
+
+def run(arguments, directory):
+    """
+    Runs the scenario for every worker count and returns the results
+    """
+    environment = get_environment(arguments.env)
+    payloads = None
+    if arguments.scenario and os.path.exists(arguments.scenario):
+        payloads = read_scenario(arguments.scenario)
+        print('Replaying {} requests of {}'.format(len(payloads), arguments.scenario))
+    results = []
+    for workers in arguments.workers:
+        process, url = start_server(workers, arguments.port, directory, environment)
+        try:
+            if payloads is None:
+                payloads = synthesize_scenario(
+                    url, arguments.sessions, arguments.interactions, arguments.seed
+                )
+                print('Synthesized {} requests'.format(len(payloads)))
+                if arguments.scenario:
+                    write_scenario(arguments.scenario, payloads)
+            number = arguments.requests or len(payloads)
+            replay(url, payloads, arguments.concurrency, min(arguments.warmup, number))
+            latencies, errors, duration = replay(
+                url, payloads, arguments.concurrency, number
+            )
+            rss = get_worker_rss(process)
+        finally:
+            stop_server(process)
+        results.append({
+            'workers': workers,
+            'concurrency': arguments.concurrency,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'error_statuses': sorted(set(errors)),
+            'throughput': len(latencies) / duration,
+            'p50_ms': get_percentile(latencies, 50),
+            'p95_ms': get_percentile(latencies, 95),
+            'p99_ms': get_percentile(latencies, 99),
+            'worker_rss_mib': rss
+        })
+        result = results[-1]
+        print(
+            '  {:>2} workers {:>6} requests {:>4} errors {:8.1f} req/s '
+            'p50 {:8.1f} ms p95 {:8.1f} ms p99 {:8.1f} ms RSS {} MiB'.format(
+                workers, result['requests'], result['errors'], result['throughput'],
+                result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                ' '.join('{:.0f}'.format(x) for x in rss) or '-'
+            )
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenario', help='JSON lines of callback payloads')
+    parser.add_argument('--requests', type=int, help='by default one pass over the scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='requests before measuring')
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--interactions', type=int, default=10, help='per session')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--dir', default='.', help='directory with the dataset')
+    parser.add_argument('--synthetic-scale', type=float, help='run on a synthetic dataset')
+    parser.add_argument('--env', nargs='*', default=[], help='settings of the app, NAME=VALUE')
+    parser.add_argument('--output', help='JSON file, by default named after the commit')
+    arguments = parser.parse_args()
+
+    if arguments.scenario:
+        arguments.scenario = os.path.abspath(arguments.scenario)
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = os.path.abspath(arguments.dir)
+        if arguments.synthetic_scale:
+            directory = temporary
+            write_source_file(
+                os.path.join(directory, c.DATASET_FILE), arguments.synthetic_scale, arguments.seed
+            )
+        results = run(arguments, directory)
+
+    commit = get_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.now().isoformat(),
+        'python': '.'.join(map(str, sys.version_info[:3])),
+        'cpus': os.cpu_count(),
+        'settings': arguments.env,
+        'results': results
+    }
+    output = arguments.output or os.path.join(RESULTS_DIR, 'load_{}.json'.format(commit))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print('Results stored in {}'.format(output))
+    errors = sum(x['errors'] for x in results)
+    if errors:
+        print('{} requests failed with status {}'.format(
+            errors, ', '.join(sorted({str(y) for x in results for y in x['error_statuses']}))
+        ))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
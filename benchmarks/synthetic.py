@@ -0,0 +1,92 @@
+import os
+import numpy as np
+import pandas as pd
+import constants as c
+import data as ds
+
+CURRENT_AIRPORTS = 330
+CURRENT_DAYS = 2131
+CURRENT_STATES = 42
+FIRST_DATE = '2016-01-01'
+AIRPORT_DATA_SHARE = 0.6
+
+
+def get_dimensions(scale):
+    """
+    Returns number of airports and days of a dataset scale times
+    larger than the current one. Both dimensions grow, so that
+    both more airports and a longer history are covered.
+    """
+    factor = np.sqrt(scale)
+    return int(round(CURRENT_AIRPORTS * factor)), int(round(CURRENT_DAYS * factor))
+
+
+def generate_dataset(scale=1, seed=0):
+    """
+    Returns a dataset with the schema and types of the loaded one
+    and scale times as many airport days as the current dataset.
+    Daily traffic follows a yearly seasonality around a random
+    airport size, airport reported counters are missing for
+    part of the airports.
+    """
+    rng = np.random.default_rng(seed)
+    number_of_airports, number_of_days = get_dimensions(scale)
+    dates = pd.date_range(FIRST_DATE, periods=number_of_days, freq='D')
+
+    airport_states = rng.integers(0, CURRENT_STATES, number_of_airports)
+    airport_sizes = rng.lognormal(4.5, 1.1, number_of_airports)
+    airport_reports = rng.random(number_of_airports) < AIRPORT_DATA_SHARE
+
+    day_codes = np.repeat(np.arange(number_of_days), number_of_airports)
+    airport_codes = np.tile(np.arange(number_of_airports), number_of_days)
+    row_dates = dates[day_codes]
+
+    season = 1 + 0.25 * np.sin(2 * np.pi * (row_dates.dayofyear.values - 100) / 365)
+    expected = airport_sizes[airport_codes] * season
+    departures = rng.poisson(expected).astype(np.int32)
+    arrivals = rng.poisson(expected).astype(np.int32)
+    reported = airport_reports[airport_codes]
+
+    def airport_counter(values):
+        counter = values.astype(np.float32)
+        counter[~reported] = np.nan
+        return counter
+
+    airport_names = np.array(['Airport {:05d}'.format(x) for x in range(number_of_airports)])
+    airport_icao = np.array(['X{:04d}'.format(x) for x in range(number_of_airports)])
+    state_names = np.array(['State {:02d}'.format(x) for x in range(CURRENT_STATES)])
+
+    data = pd.DataFrame({
+        c.YEAR: row_dates.year.values,
+        c.MONTH_NUM: row_dates.month.values,
+        c.MONTH_MON: pd.Categorical.from_codes(
+            row_dates.month.values - 1, categories=c.MONTH_NAMES
+        ),
+        c.DATE: row_dates.values,
+        c.AIRPORT_CODE: pd.Categorical.from_codes(
+            airport_codes, categories=airport_icao
+        ),
+        c.AIRPORT_NAME: pd.Categorical.from_codes(
+            airport_codes, categories=airport_names
+        ),
+        c.STATE_NAME: pd.Categorical.from_codes(
+            airport_states[airport_codes], categories=state_names
+        ),
+        c.NM_DEP_FLIGHTS: departures,
+        c.NM_ARR_FLIGHTS: arrivals,
+        c.NM_TOTAL_FLIGHTS: departures + arrivals,
+        c.AIRPORT_DEP_FLIGHTS: airport_counter(departures),
+        c.AIRPORT_ARR_FLIGHTS: airport_counter(arrivals),
+        c.AIRPORT_TOTAL_FLIGHTS: airport_counter(departures + arrivals)
+    })
+    return ds.index_by_date(ds.compact_dataset(data[ds.DATASET_COLUMNS]))
+
+
+def write_source_file(path, scale=1, seed=0):
+    """
+    Writes a synthetic dataset in the format of the EUROCONTROL csv file
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    generate_dataset(scale, seed).to_csv(
+        path, sep=';', index=False, date_format='%d/%m/%Y'
+    )
@@ -0,0 +1,109 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+# Named caches whose counters are exposed on /metrics, a cache replaced
+# by a newer one with the same name is not kept alive by the registry
+caches = weakref.WeakValueDictionary()
+
+
+class _PendingValue:
+    """
+    Value being computed by one thread and awaited by others
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache with hit/miss counters.
+    Concurrent requests for the same missing key wait for a single
+    computation instead of repeating it. Caches created with a name
+    are registered in caches.
+    """
+    def __init__(self, maxsize, name=None):
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        if name is not None:
+            caches[name] = self
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value of the key, computing it with
+        compute() when it is missing
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            pending = self._pending.get(key)
+            is_owner = pending is None
+            if is_owner:
+                pending = self._pending[key] = _PendingValue()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not is_owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            value = compute()
+        except Exception as error:
+            with self._lock:
+                del self._pending[key]
+            pending.error = error
+            pending.event.set()
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        pending.value = value
+        pending.event.set()
+        return value
+
+    def values(self):
+        """
+        Returns the cached values without updating their recency
+        """
+        with self._lock:
+            return list(self._items.values())
+
+    def clear(self):
+        """
+        Removes all cached values, counters are kept
+        """
+        with self._lock:
+            self._items.clear()
+
+    def info(self):
+        """
+        Returns hit/miss counters and the size of the cache
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._items),
+            'maxsize': self.maxsize
+        }
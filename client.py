@@ -0,0 +1,154 @@
+"""
+Client-side mode of the dashboard.
+
+With CLIENTSIDE_MODE enabled a page fetches from /client/aggregates.json
+per day and per state sums of the six flight columns together with the
+numbers of reported values, as base64 encoded little endian typed arrays.
+The document is built once per dataset version and revalidated by the
+browser with its ETag, so it is neither part of the layout nor sent again
+while the dataset is unchanged. Clientside callbacks (assets/clientside.js)
+then draw the flights chart, the seasonal chart and the map for any
+movement, period and chart mode without calling the server. Selecting
+airports fetches the same arrays summed over the selected airports, or
+per selected airport to draw one line per airport.
+"""
+import base64
+import hashlib
+import json
+import numpy as np
+from flask import Response
+import constants as c
+import data as ds
+import response_cache
+import serialization
+from caching import LRUCache
+
+AGGREGATES_URL = '/client/aggregates.json'
+
+SUM_TYPE = '<f4'
+COUNT_TYPE = '<i4'
+COUNT_COLUMNS = dict(
+    [(x, c.NM_TOTAL_FLIGHTS) for x in c.NM_FLIGHT_COLUMNS] +
+    [(x, x) for x in c.AIRPORT_FLIGHT_COLUMNS]
+)
+MOVEMENTS = [[], ['Arrival'], ['Departure']]
+
+state_cache = LRUCache(2, 'client_state')
+selection_cache = LRUCache(c.SERIES_CACHE_SIZE, 'client_selection')
+
+
+def encode(values, dtype):
+    return base64.b64encode(
+        np.ascontiguousarray(values, dtype=dtype).tobytes()
+    ).decode()
+
+
+def build_aggregates(cube, group_codes, groups):
+    """
+    Returns per day and group sums and reported counts of the flight
+    columns, group_codes gives the group of every airport (-1 for
+    airports left out). Arrays are flattened day by day.
+    """
+    membership = cube.group_membership(group_codes, len(groups))
+    return {
+        'first_date': cube.dates[0].strftime('%Y-%m-%d'),
+        'days': len(cube.dates),
+        'groups': list(groups),
+        'sums': {
+            column: encode(
+                cube.daily_group_values(cube.sums[column], 0, len(cube.dates), membership),
+                SUM_TYPE
+            )
+            for column in c.FLIGHT_COLUMNS
+        },
+        'counts': {
+            column: encode(
+                cube.daily_group_values(cube.counts[column], 0, len(cube.dates), membership),
+                COUNT_TYPE
+            )
+            for column in set(COUNT_COLUMNS.values())
+        },
+        'count_columns': COUNT_COLUMNS
+    }
+
+
+def build_state_aggregates(snapshot):
+    """
+    Returns the arrays of all states with the settings the
+    clientside callbacks need to match the server figures
+    """
+    cube = snapshot.cube
+    aggregates = build_aggregates(cube, cube.airport_state_codes, cube.states)
+    aggregates.update({
+        'version': snapshot.version,
+        'flight_columns': {
+            ''.join(x): ds.get_flight_columns(x) for x in MOVEMENTS
+        },
+        'month_names': c.MONTH_NAMES,
+        'smoothing': {'window': c.SMOOTHING_WINDOW, 'order': c.SMOOTHING_ORDER}
+    })
+    return aggregates
+
+
+def get_state_document():
+    """
+    Returns the aggregates of all states encoded as JSON,
+    built once per dataset version
+    """
+    snapshot = ds.get_snapshot()
+    return state_cache.get_or_compute(
+        snapshot.version,
+        lambda: json.dumps(build_state_aggregates(snapshot), separators=(',', ':')).encode()
+    )
+
+
+def get_etag(version):
+    """
+    Returns ETag of the aggregates: it changes with the dataset
+    version and with the settings and code of the app
+    """
+    description = json.dumps([version, response_cache.fingerprint])
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def serve_aggregates():
+    """
+    Answers the aggregates of all states, or 304 when the
+    browser already has the current ones
+    """
+    snapshot = ds.get_snapshot()
+    etag = get_etag(snapshot.version)
+    if serialization.is_unchanged(etag):
+        response = Response(status=304)
+    else:
+        with ds.pinned_snapshot(snapshot):
+            response = Response(get_state_document(), mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def get_selection_aggregates(airports=None, states=None, by_airport=False):
+    """
+    Returns the arrays summed over the airports matching the filters,
+    or of every matching airport to compare them
+    """
+    snapshot = ds.get_snapshot()
+    key = ds.normalize_filter(airports, states) + (by_airport,)
+
+    def compute():
+        cube = snapshot.cube
+        if by_airport:
+            names, group_codes = ds.get_comparison_groups(cube, airports, states)
+            return build_aggregates(cube, group_codes, names)
+        group_codes = np.where(cube.airport_mask(airports, states), 0, -1)
+        return build_aggregates(cube, group_codes, ['selection'])
+
+    return selection_cache.get_or_compute(key, compute)
+
+
+def init_app(server):
+    """
+    Registers the aggregates route on the Flask server
+    """
+    server.add_url_rule(AGGREGATES_URL, 'client_aggregates', serve_aggregates)
@@ -0,0 +1,58 @@
+import os
+
+
+def get_flag(name, default=False):
+    """
+    Reads a boolean setting from the environment
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_string(name, default):
+    """
+    Reads a text setting from the environment
+    """
+    return os.environ.get(name, default).strip().lower()
+
+
+def get_path(name):
+    """
+    Reads a file path setting from the environment, None when unset
+    """
+    value = os.environ.get(name, '').strip()
+    return value or None
+
+
+def get_int(name, default):
+    """
+    Reads an integer setting from the environment
+    """
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+LAZY_PARTITIONS = get_flag('LAZY_PARTITIONS')
+PARTITION_CACHE_SIZE = get_int('PARTITION_CACHE_SIZE', 3)
+FAST_START = get_flag('FAST_START')
+PRELOAD_DATASET = get_flag('PRELOAD_DATASET', not FAST_START)
+INSTRUMENTATION = get_flag('INSTRUMENTATION')
+RESPONSE_CACHE = get_string('RESPONSE_CACHE', 'sqlite')
+RESPONSE_CACHE_MAX_MB = get_int('RESPONSE_CACHE_MAX_MB', 256)
+WARMUP = get_flag('WARMUP', True)
+WARMUP_TOP_STATES = get_int('WARMUP_TOP_STATES', 10)
+WARMUP_BUDGET_SECONDS = get_int('WARMUP_BUDGET_SECONDS', 20)
+TOP_AIRPORTS = get_int('TOP_AIRPORTS', 5)
+TOP_AIRPORTS_MOVEMENT = get_string('TOP_AIRPORTS_MOVEMENT', 'total')
+TOP_AIRPORTS_STATISTIC = get_string('TOP_AIRPORTS_STATISTIC', 'average')
+PIPELINE_THREADS = get_int('PIPELINE_THREADS', min(4, os.cpu_count() or 1))
+CLIENTSIDE_MODE = get_flag('CLIENTSIDE_MODE')
+STARTUP_BUDGET_SECONDS = get_int('STARTUP_BUDGET_SECONDS', 10)
+RECORD_CALLBACKS = get_path('RECORD_CALLBACKS')
+QUERY_BACKEND = get_string('QUERY_BACKEND', 'pandas')
+FIGURE_DECIMALS = get_int('FIGURE_DECIMALS', 1)
+RESPONSE_BUDGET_KB = get_int('RESPONSE_BUDGET_KB', 256)
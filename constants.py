@@ -11,4 +11,66 @@ NM_TOTAL_FLIGHTS = 'FLT_TOT_1'
 AIRPORT_DEP_FLIGHTS = 'FLT_DEP_IFR_2'
 AIRPORT_ARR_FLIGHTS = 'FLT_ARR_IFR_2'
 AIRPORT_TOTAL_FLIGHTS = 'FLT_TOT_IFR_2'
-DAILY_AVERAGE = 'Daily Average'
\ No newline at end of file
+DAILY_AVERAGE = 'Daily Average'
+TOTAL_FLIGHTS = 'Total Flights'
+
+NM_FLIGHT_COLUMNS = [NM_DEP_FLIGHTS, NM_ARR_FLIGHTS, NM_TOTAL_FLIGHTS]
+AIRPORT_FLIGHT_COLUMNS = [
+    AIRPORT_DEP_FLIGHTS, AIRPORT_ARR_FLIGHTS, AIRPORT_TOTAL_FLIGHTS
+]
+FLIGHT_COLUMNS = NM_FLIGHT_COLUMNS + AIRPORT_FLIGHT_COLUMNS
+MONTH_NAMES = [
+    'JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN',
+    'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'
+]
+TOP_AIRPORTS_SOURCES = ['NM', 'APT']
+TOP_AIRPORTS_COLUMNS = {
+    'NM': {
+        'total': NM_TOTAL_FLIGHTS,
+        'arrival': NM_ARR_FLIGHTS,
+        'departure': NM_DEP_FLIGHTS
+    },
+    'APT': {
+        'total': AIRPORT_TOTAL_FLIGHTS,
+        'arrival': AIRPORT_ARR_FLIGHTS,
+        'departure': AIRPORT_DEP_FLIGHTS
+    }
+}
+
+DATASET_FILE = 'datasets/Airport_Traffic.csv'
+DATASET_PARTITION_DIR = 'datasets/partitions'
+DATASET_CACHE_META_FILE = 'datasets/Airport_Traffic.meta.json'
+DATASET_SUMMARY_FILE = 'datasets/Airport_Traffic.summary.meta.json'
+DATASET_CACHE_FORMAT = 4
+DATASET_DELTA_DIR = 'datasets/deltas'
+DATASET_PARQUET_DIR = 'datasets/parquet'
+DATASET_VERSION_LENGTH = 12
+DELTA_POLL_INTERVAL = 60
+
+EXPORT_CHUNK_DAYS = 31
+
+GEOJSON_FILE = 'assets/europe.geojson'
+MAP_SIMPLIFY_TOLERANCE = 0.05
+MAP_MODE_DAY = 'day'
+MAP_MODE_PERIOD = 'period'
+
+SEASONAL_MODE_COMBINED = 'combined'
+SEASONAL_MODE_YEARS = 'years'
+SEASONAL_MODE_PREVIOUS = 'previous'
+PREVIOUS_YEAR_SUFFIX = '_PREVIOUS_YEAR'
+
+FLIGHTS_MODE_TOTAL = 'total'
+FLIGHTS_MODE_COMPARE = 'compare'
+MAX_COMPARED_SERIES = 50
+
+SMOOTHING_WINDOW = 53
+SMOOTHING_ORDER = 3
+MAX_CHART_POINTS = 1000
+CLIENT_LOADER_INTERVAL = 100
+SERIES_CACHE_SIZE = 32
+
+RESPONSE_CACHE_SQLITE_FILE = 'datasets/response_cache.sqlite'
+RESPONSE_CACHE_DIR = 'datasets/response_cache'
+RESPONSE_CACHE_ACCESS_RESOLUTION = 60
+
+WARMUP_FILTERS_FILE = 'warmup_filters.json'
@@ -0,0 +1,379 @@
+import numpy as np
+import pandas as pd
+import constants as c
+
+INT32_LIMIT = np.iinfo(np.int32).max
+
+
+def get_sum_dtype(cell_values, number_of_airports):
+    """
+    Returns int32 when the per cell values are whole non-negative numbers
+    (flights) whose total per airport fits it, float64 otherwise
+    """
+    if len(cell_values) and (
+        cell_values.min() < 0 or np.any(cell_values != np.round(cell_values))
+    ):
+        return np.float64
+    totals = cell_values.reshape(-1, number_of_airports).sum(axis=0)
+    if len(totals) and totals.max() >= INT32_LIMIT:
+        return np.float64
+    return np.int32
+
+
+class PrefixRows:
+    """
+    Prefix array made of row segments, the segments of the cube it
+    extends are shared instead of copied. Segments narrower than the
+    airport axis (airports added later) are padded with zeros on read.
+    Indexing rows, optionally with a boolean mask of airports, returns
+    numpy arrays and only copies what is read.
+    """
+    def __init__(self, segments, width):
+        self.segments = list(segments)
+        self.width = width
+        self.starts = np.cumsum([0] + [len(x) for x in self.segments])
+        self.shape = (int(self.starts[-1]), width)
+        self.dtype = np.result_type(*self.segments)
+        self.nbytes = sum(x.nbytes for x in self.segments)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read(self, segment, rows, mask):
+        """
+        Returns rows of a segment with the masked airports of the full width
+        """
+        values = segment[rows]
+        width = segment.shape[1]
+        if mask is not None:
+            values = values[..., mask[:width]]
+            padding = int(np.count_nonzero(mask[width:]))
+        else:
+            padding = self.width - width
+        if padding:
+            values = np.pad(values, [(0, 0)] * (values.ndim - 1) + [(0, padding)])
+        return values.astype(self.dtype, copy=False)
+
+    def __getitem__(self, key):
+        mask = None
+        if isinstance(key, tuple):
+            key, mask = key
+            mask = np.asarray(mask)
+            if mask.dtype != bool:
+                return self[key][:, mask]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self[np.arange(start, stop, step), mask]
+            pieces = []
+            first = max(np.searchsorted(self.starts, start, side='right') - 1, 0)
+            for index in range(first, len(self.segments)):
+                offset = self.starts[index]
+                if offset >= stop:
+                    break
+                rows = slice(max(start - offset, 0), stop - offset)
+                pieces.append(self._read(self.segments[index], rows, mask))
+            if len(pieces) == 1:
+                return pieces[0]
+            if not pieces:
+                width = self.width if mask is None else int(np.count_nonzero(mask))
+                return np.zeros((0, width), dtype=self.dtype)
+            return np.concatenate(pieces)
+        if np.ndim(key) == 0:
+            key = int(key)
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('row {} out of {}'.format(key, len(self)))
+            index = np.searchsorted(self.starts, key, side='right') - 1
+            return self._read(self.segments[index], key - self.starts[index], mask)
+        rows = np.asarray(key)
+        segments = np.searchsorted(self.starts, rows, side='right') - 1
+        width = self.width if mask is None else int(np.count_nonzero(mask))
+        result = np.empty((len(rows), width), dtype=self.dtype)
+        for index in np.unique(segments):
+            selected = segments == index
+            result[selected] = self._read(
+                self.segments[index], rows[selected] - self.starts[index], mask
+            )
+        return result
+
+
+class TrafficCube:
+    """
+    Date x airport aggregate of the dataset.
+    For every flight column it keeps cumulative sums and cumulative
+    counts of reported values along the date axis, so totals and
+    averages over any date range are a difference of two rows.
+    Sums of whole numbers of flights are kept as int32, half the
+    memory of float64.
+    """
+    def __init__(self, data, first_date=None, airport_states=None):
+        """
+        Aggregates the data from first_date (by default the first date
+        of the data) to its last date. airport_states fixes the order
+        of airports on the airport axis, new airports are appended.
+        """
+        self.first_date = data[c.DATE].min() if first_date is None else first_date
+        self.dates = pd.date_range(self.first_date, data[c.DATE].max(), freq='D')
+
+        pairs = data[[c.AIRPORT_NAME, c.STATE_NAME]].drop_duplicates(
+            subset=c.AIRPORT_NAME
+        ).astype(str).sort_values(by=c.AIRPORT_NAME)
+        airport_states = dict(airport_states or {})
+        for airport, state in zip(pairs[c.AIRPORT_NAME], pairs[c.STATE_NAME]):
+            airport_states.setdefault(airport, state)
+        self._set_airports(airport_states)
+
+        names = pd.Categorical(data[c.AIRPORT_NAME])
+        airport_codes = self.airports.get_indexer(
+            names.categories.astype(str)
+        )[names.codes]
+        day_codes = (data[c.DATE] - self.first_date).dt.days.values
+        cells = day_codes * len(self.airports) + airport_codes
+
+        self.sums = {}
+        self.counts = {}
+        self.counts[c.NM_TOTAL_FLIGHTS] = self._accumulate(
+            np.bincount(cells, minlength=self._size()), np.int32
+        )
+        for column in c.NM_FLIGHT_COLUMNS:
+            self.counts[column] = self.counts[c.NM_TOTAL_FLIGHTS]
+        for column in c.FLIGHT_COLUMNS:
+            values = data[column].values.astype(np.float64)
+            reported = ~np.isnan(values)
+            cell_sums = np.bincount(
+                cells[reported], weights=values[reported], minlength=self._size()
+            )
+            self.sums[column] = self._accumulate(
+                cell_sums, get_sum_dtype(cell_sums, len(self.airports))
+            )
+            if column in c.AIRPORT_FLIGHT_COLUMNS:
+                self.counts[column] = self._accumulate(np.bincount(
+                    cells[reported], minlength=self._size()
+                ), np.int32)
+
+    def _set_airports(self, airport_states):
+        self.airport_states = airport_states
+        self.airports = pd.Index(list(airport_states))
+        airport_states = list(airport_states.values())
+        self.states = pd.Index(np.unique(airport_states))
+        self.airport_state_codes = self.states.get_indexer(airport_states)
+
+    def extended(self, data):
+        """
+        Returns a new cube with the data appended. The data must only
+        contain days after the last day of the cube: existing prefix
+        rows are shared with this cube, not copied, and only the new
+        days are aggregated and stored.
+        """
+        addition = TrafficCube(
+            data,
+            first_date=self.dates[-1] + pd.Timedelta(days=1),
+            airport_states=self.airport_states
+        )
+        result = TrafficCube.__new__(TrafficCube)
+        result.first_date = self.first_date
+        result.dates = self.dates.append(addition.dates)
+        result._set_airports(addition.airport_states)
+
+        def append(previous, added):
+            width = len(result.airports)
+            last = np.pad(previous[-1], (0, width - previous.shape[1]))
+            dtype = np.result_type(previous.dtype, added.dtype)
+            if dtype == np.int32 and (
+                int(last.max(initial=0)) + int(added[-1].max(initial=0))
+                >= INT32_LIMIT
+            ):
+                dtype = np.float64
+            segments = getattr(previous, 'segments', [previous])
+            return PrefixRows(
+                segments + [last.astype(dtype) + added[1:].astype(dtype)], width
+            )
+
+        arrays = {}
+        result.sums = {
+            column: append(self.sums[column], addition.sums[column])
+            for column in self.sums
+        }
+        result.counts = {}
+        for column in self.counts:
+            key = id(self.counts[column])
+            if key not in arrays:
+                arrays[key] = append(self.counts[column], addition.counts[column])
+            result.counts[column] = arrays[key]
+        return result
+
+    def _size(self):
+        return len(self.dates) * len(self.airports)
+
+    def _accumulate(self, cell_values, dtype):
+        """
+        Turns flat per cell values into prefix sums along the date axis
+        with a leading row of zeros
+        """
+        prefix = np.zeros((len(self.dates) + 1, len(self.airports)), dtype=dtype)
+        np.cumsum(
+            cell_values.reshape(len(self.dates), len(self.airports)).astype(dtype),
+            axis=0, out=prefix[1:]
+        )
+        return prefix
+
+    def nbytes(self):
+        """
+        Returns memory used by the prefix arrays
+        """
+        arrays = {id(x): x for x in list(self.sums.values()) + list(self.counts.values())}
+        return sum(x.nbytes for x in arrays.values())
+
+    def date_range(self, start_date=None, end_date=None):
+        """
+        Returns prefix row bounds (start, stop) of the dates
+        between start and end date (both inclusive)
+        """
+        start = 0 if start_date is None else self.dates.searchsorted(
+            pd.to_datetime(start_date), side='left'
+        )
+        stop = len(self.dates) if end_date is None else self.dates.searchsorted(
+            pd.to_datetime(end_date), side='right'
+        )
+        return start, max(start, stop)
+
+    def airport_mask(self, airports=None, states=None):
+        """
+        Returns boolean mask of airports matching the filters,
+        the same way filter_dataset combines them
+        """
+        mask = np.ones(len(self.airports), dtype=bool)
+        if airports:
+            mask &= self.airports.isin(airports)
+        if states:
+            mask &= self.states[self.airport_state_codes].isin(states)
+        return mask
+
+    def range_sums(self, column, start, stop):
+        """
+        Returns per airport sums of the column over prefix rows [start, stop)
+        """
+        return (self.sums[column][stop] - self.sums[column][start]).astype(np.float64)
+
+    def range_counts(self, column, start, stop):
+        """
+        Returns per airport number of reported values over prefix rows [start, stop)
+        """
+        return self.counts[column][stop] - self.counts[column][start]
+
+    def daily_sums(self, column, start, stop, mask):
+        """
+        Returns per day sums of the column over the masked airports
+        """
+        prefix = self.sums[column][start:stop + 1, mask].sum(axis=1)
+        return np.diff(prefix).astype(np.float64)
+
+    def daily_counts(self, column, start, stop, mask):
+        """
+        Returns per day number of reported values over the masked airports
+        """
+        prefix = self.counts[column][start:stop + 1, mask].sum(axis=1)
+        return np.diff(prefix)
+
+    def group_membership(self, group_codes, number_of_groups):
+        """
+        Returns airports x groups matrix with 1 where the airport belongs
+        to the group, group_codes gives the group of every airport
+        (-1 for airports left out)
+        """
+        membership = np.zeros((len(self.airports), number_of_groups))
+        selected = group_codes >= 0
+        membership[np.flatnonzero(selected), group_codes[selected]] = 1
+        return membership
+
+    def daily_group_values(self, prefix, start, stop, membership):
+        """
+        Returns days x groups values of the prefix array between
+        prefix rows start and stop, in one matrix product
+        """
+        return np.diff(prefix[start:stop + 1], axis=0) @ membership
+
+    def per_state(self, values, mask):
+        """
+        Adds up per airport values of the masked airports by state
+        """
+        return np.bincount(
+            self.airport_state_codes[mask],
+            weights=values[mask],
+            minlength=len(self.states)
+        )
+
+
+class MonthlyCube:
+    """
+    Month x airport aggregate derived from the daily traffic cube.
+    For every flight column it keeps the sums and the counts of reported
+    values of each month, months cut by a period are completed from
+    the daily prefix rows.
+    """
+    def __init__(self, traffic_cube):
+        self.daily = traffic_cube
+        months = traffic_cube.dates.to_period('M')
+        first_days = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        self.months = months[first_days]
+        self.years = self.months.year.values
+        self.month_numbers = self.months.month.values
+        self.boundaries = np.r_[first_days, len(months)]
+
+        arrays = {}
+        self.sums = {
+            column: np.diff(prefix[self.boundaries], axis=0)
+            for column, prefix in traffic_cube.sums.items()
+        }
+        self.counts = {}
+        for column, prefix in traffic_cube.counts.items():
+            key = id(prefix)
+            if key not in arrays:
+                arrays[key] = np.diff(prefix[self.boundaries], axis=0)
+            self.counts[column] = arrays[key]
+
+    def month_range(self, start, stop):
+        """
+        Returns bounds (first, last) of the months
+        overlapping daily prefix rows [start, stop)
+        """
+        first = np.searchsorted(self.boundaries, start, side='right') - 1
+        last = np.searchsorted(self.boundaries, stop, side='left')
+        return first, max(first, last)
+
+    def _monthly(self, monthly, prefix, start, stop, mask):
+        """
+        Returns per month values over the masked airports, the first and
+        last months are recomputed from the daily prefix rows when the
+        period cuts them at either end
+        """
+        first, last = self.month_range(start, stop)
+        values = monthly[first:last][:, mask].sum(axis=1)
+        for index, month in {0: first, -1: last - 1}.items():
+            if last <= first:
+                break
+            begin = max(start, self.boundaries[month])
+            end = min(stop, self.boundaries[month + 1])
+            if (begin, end) != (self.boundaries[month], self.boundaries[month + 1]):
+                values[index] = (prefix[end] - prefix[begin])[mask].sum()
+        return values
+
+    def monthly_sums(self, column, start, stop, mask):
+        """
+        Returns per month sums of the column over the masked airports
+        and daily prefix rows [start, stop)
+        """
+        return self._monthly(
+            self.sums[column], self.daily.sums[column], start, stop, mask
+        )
+
+    def monthly_counts(self, column, start, stop, mask):
+        """
+        Returns per month number of reported values over the masked
+        airports and daily prefix rows [start, stop)
+        """
+        return self._monthly(
+            self.counts[column], self.daily.counts[column], start, stop, mask
+        )
@@ -1,10 +1,675 @@
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
 import pandas as pd
 import numpy as np
 import constants as c
+import config
+import instrumentation
+from caching import LRUCache
+from cube import MonthlyCube, TrafficCube
 from datetime import timedelta
+from pandas.api.types import union_categoricals
 
-dataset = pd.read_csv('datasets/Airport_Traffic.csv', delimiter=';')
-dataset[c.DATE] = pd.to_datetime(dataset[c.DATE], format='%d/%m/%Y')
+logger = logging.getLogger(__name__)
+
+CATEGORICAL_COLUMNS = [
+    c.MONTH_MON, c.AIRPORT_CODE, c.AIRPORT_NAME, c.STATE_NAME
+]
+DATASET_COLUMNS = [
+    c.YEAR, c.MONTH_NUM, c.MONTH_MON, c.DATE,
+    c.AIRPORT_CODE, c.AIRPORT_NAME, c.STATE_NAME
+] + c.FLIGHT_COLUMNS
+
+
+def get_file_digest(path):
+    """
+    Returns md5 hex digest of a file, read in chunks
+    """
+    digest = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compact_dataset(data):
+    """
+    Downcasts numeric columns of the dataset to the smallest
+    types holding its values. NM counters never miss values
+    and become int32, airport counters contain gaps and become float32.
+    """
+    data[c.YEAR] = data[c.YEAR].astype(np.int16)
+    data[c.MONTH_NUM] = data[c.MONTH_NUM].astype(np.int8)
+    for column in c.NM_FLIGHT_COLUMNS:
+        data[column] = data[column].astype(np.int32)
+    for column in c.AIRPORT_FLIGHT_COLUMNS:
+        data[column] = data[column].astype(np.float32)
+    return data
+
+
+def read_source_dataset(path):
+    """
+    Parses the EUROCONTROL csv file into a typed dataframe:
+    only used columns are kept, dates are parsed,
+    names are stored as categoricals and counters are downcast.
+    """
+    data = pd.read_csv(
+        path, delimiter=';', usecols=DATASET_COLUMNS,
+        dtype={column: 'category' for column in CATEGORICAL_COLUMNS}
+    )
+    data = data[DATASET_COLUMNS]
+    data[c.DATE] = pd.to_datetime(data[c.DATE], format='%d/%m/%Y')
+    data = data.sort_values(by=c.DATE, kind='mergesort', ignore_index=True)
+    return compact_dataset(data)
+
+
+def index_by_date(data):
+    """
+    Uses flight dates as the index of the dataset, sorting it first
+    if needed. The index shares memory with the date column and lets
+    date filters use binary search instead of full scans.
+    """
+    if not data[c.DATE].is_monotonic_increasing:
+        data = data.sort_values(by=c.DATE, kind='mergesort', ignore_index=True)
+    data.index = pd.DatetimeIndex(data[c.DATE].values)
+    return data
+
+
+def is_indexed_by_date(data):
+    """
+    Checks if a dataset has a sorted date index
+    """
+    return (isinstance(data.index, pd.DatetimeIndex) and
+            data.index.is_monotonic_increasing)
+
+
+def get_memory_usage(data):
+    """
+    Returns a series with memory used by each column in bytes.
+    The date index is left out as it shares memory with the date column.
+    Partitioned datasets report the years currently in memory.
+    """
+    if isinstance(data, SEGMENTED_DATASETS):
+        frames = data.loaded_frames()
+        if not frames:
+            return pd.Series(0, index=DATASET_COLUMNS)
+        return sum(get_memory_usage(x) for x in frames)
+    return data.memory_usage(index=False, deep=True)
+
+
+def log_memory_usage(data):
+    """
+    Logs total memory used by the dataset and its largest columns
+    """
+    usage = get_memory_usage(data)
+    largest = usage.sort_values(ascending=False).head(3)
+    logger.info(
+        'Dataset uses %.1f MiB (%s)',
+        usage.sum() / 2 ** 20,
+        ', '.join(
+            '{} {:.1f} MiB'.format(column, size / 2 ** 20)
+            for column, size in largest.items()
+        )
+    )
+
+
+def read_cache_meta(meta_path):
+    """
+    Returns the metadata stored next to the columnar cache
+    or None if it is missing or unreadable
+    """
+    try:
+        with open(meta_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cache_fresh(source, cache, meta_path):
+    """
+    Checks if the columnar cache was built from the current csv.
+    The mtime is checked first, the content hash is only computed
+    when the mtime has changed (e.g. the file was copied again).
+    """
+    meta = read_cache_meta(meta_path)
+    if meta is None or not os.path.exists(cache):
+        return False
+    if meta.get('format') != c.DATASET_CACHE_FORMAT:
+        return False
+    stat = os.stat(source)
+    if stat.st_size != meta.get('source_size'):
+        return False
+    if stat.st_mtime == meta.get('source_mtime'):
+        return True
+    if get_file_digest(source) != meta.get('source_md5'):
+        return False
+    meta['source_mtime'] = stat.st_mtime
+    write_cache_meta(meta_path, meta)
+    return True
+
+
+def write_cache_meta(meta_path, meta):
+    """
+    Writes metadata of the columnar cache
+    """
+    with open(meta_path, 'w') as file:
+        json.dump(meta, file)
+
+
+def get_partition_path(directory, year):
+    """
+    Returns path of the feather file holding a year of data
+    """
+    return os.path.join(directory, 'YEAR={}.feather'.format(year))
+
+
+def write_cache(data, source, cache, meta_path):
+    """
+    Stores dataframe as one feather file per year together
+    with the signature of the csv it was built from.
+    Files are written next to their targets and renamed,
+    so that concurrently booting workers never read a partial file.
+    """
+    stat = os.stat(source)
+    os.makedirs(cache, exist_ok=True)
+    data = data.reset_index(drop=True)
+    years = sorted(int(x) for x in data[c.YEAR].unique())
+    for year, partition in data.groupby(c.YEAR, sort=True):
+        path = get_partition_path(cache, year)
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        partition.reset_index(drop=True).to_feather(temporary_path)
+        os.replace(temporary_path, path)
+    write_cache_meta(meta_path, {
+        'format': c.DATASET_CACHE_FORMAT,
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'source_md5': get_file_digest(source),
+        'years': years,
+        'first_date': str(data[c.DATE].min().date()),
+        'last_date': str(data[c.DATE].max().date())
+    })
+
+
+def concat_datasets(frames):
+    """
+    Returns a dataset with rows of the frames in the given order.
+    Categories of categorical columns are unioned.
+    """
+    frames = [x for x in frames if len(x)]
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.DataFrame({
+        column: union_categoricals([x[column] for x in frames])
+        if column in CATEGORICAL_COLUMNS
+        else np.concatenate([x[column].values for x in frames])
+        for column in frames[0].columns
+    })
+    return index_by_date(combined)
+
+
+class PartitionedDataset:
+    """
+    Dataset stored as one feather file per year. Years are read
+    only when a date range needs them and kept in a bounded cache,
+    rows ingested later are kept in memory.
+    """
+    def __init__(self, directory, years, first_date, last_date,
+                 cache_size=config.PARTITION_CACHE_SIZE, appended_rows=None,
+                 partition_cache=None):
+        self.directory = directory
+        self.years = list(years)
+        self.first_date = pd.to_datetime(first_date)
+        self.last_date = pd.to_datetime(last_date)
+        self.appended_rows = appended_rows
+        self.partition_cache = partition_cache or LRUCache(cache_size, 'partitions')
+
+    def read_partition(self, year):
+        """
+        Reads a year of data from disk
+        """
+        return index_by_date(pd.read_feather(
+            get_partition_path(self.directory, year)
+        ))
+
+    def load_partition(self, year):
+        """
+        Returns a year of data, reading it only if it is not cached
+        """
+        return self.partition_cache.get_or_compute(
+            year, lambda: self.read_partition(year)
+        )
+
+    def load_range(self, start_date=None, end_date=None):
+        """
+        Returns a dataset with all years overlapping the date range
+        """
+        first_year = self.first_date.year if start_date is None else (
+            pd.to_datetime(start_date).year
+        )
+        last_year = self.last_date.year if end_date is None else (
+            pd.to_datetime(end_date).year
+        )
+        frames = [
+            self.load_partition(year) for year in self.years
+            if first_year <= year <= last_year
+        ]
+        if self.appended_rows is not None:
+            frames.append(self.appended_rows)
+        if not frames:
+            return self.load_partition(self.years[0]).iloc[:0]
+        return concat_datasets(frames)
+
+    def iter_partitions(self):
+        """
+        Yields every year of data without caching it, followed
+        by the appended rows
+        """
+        for year in self.years:
+            yield self.read_partition(year)
+        if self.appended_rows is not None:
+            yield self.appended_rows
+
+    def appended(self, delta):
+        """
+        Returns the dataset with rows of delta appended,
+        sharing the partition cache
+        """
+        appended_rows = delta if self.appended_rows is None else (
+            concat_datasets([self.appended_rows, delta])
+        )
+        return PartitionedDataset(
+            self.directory, self.years, self.first_date,
+            get_date_bounds(delta)[1],
+            appended_rows=appended_rows,
+            partition_cache=self.partition_cache
+        )
+
+    def loaded_frames(self):
+        """
+        Returns the years currently held in memory
+        """
+        frames = self.partition_cache.values()
+        if self.appended_rows is not None:
+            frames.append(self.appended_rows)
+        return frames
+
+
+class AppendedDataset:
+    """
+    Dataset held in memory with rows ingested later kept apart,
+    so that appending rows does not copy the rows loaded at startup
+    (shared between workers forked after preloading)
+    """
+    def __init__(self, data, appended_rows):
+        self.data = data
+        self.appended_rows = appended_rows
+        self.first_date = get_date_bounds(data)[0]
+        self.last_date = get_date_bounds(appended_rows)[1]
+
+    def load_range(self, start_date=None, end_date=None):
+        """
+        Returns a dataset with the rows of the date range
+        """
+        frames = [filter_dataset_by_date(self.data, start_date, end_date)]
+        if end_date is None or pd.to_datetime(end_date) > get_date_bounds(self.data)[1]:
+            frames.append(self.appended_rows)
+        if not any(len(x) for x in frames):
+            return frames[0]
+        return concat_datasets(frames)
+
+    def iter_partitions(self):
+        """
+        Yields the rows loaded at startup followed by the appended rows
+        """
+        yield self.data
+        yield self.appended_rows
+
+    def appended(self, delta):
+        """
+        Returns the dataset with rows of delta appended
+        """
+        return AppendedDataset(
+            self.data, concat_datasets([self.appended_rows, delta])
+        )
+
+    def loaded_frames(self):
+        return [self.data, self.appended_rows]
+
+
+SEGMENTED_DATASETS = (PartitionedDataset, AppendedDataset)
+
+
+def open_partitions(cache, meta_path):
+    """
+    Returns the partitioned dataset described by the cache metadata
+    """
+    meta = read_cache_meta(meta_path)
+    return PartitionedDataset(
+        cache, meta['years'], meta['first_date'], meta['last_date']
+    )
+
+
+def load_dataset(source=c.DATASET_FILE, cache=c.DATASET_PARTITION_DIR,
+                 meta_path=c.DATASET_CACHE_META_FILE, lazy=config.LAZY_PARTITIONS):
+    """
+    Loads the airport traffic dataset.
+    The csv is parsed only once, afterwards the typed columnar
+    cache is read as long as the csv is unchanged.
+    With lazy loading the partitioned dataset is returned
+    and years are only read when they are needed.
+    """
+    start = time.perf_counter()
+    if is_cache_fresh(source, cache, meta_path):
+        if lazy:
+            data = open_partitions(cache, meta_path)
+            logger.info(
+                'Opened %d yearly partitions from %s in %.3f s',
+                len(data.years), cache, time.perf_counter() - start
+            )
+            return data
+        data = concat_datasets([
+            pd.read_feather(get_partition_path(cache, year))
+            for year in read_cache_meta(meta_path)['years']
+        ])
+        origin = cache
+    else:
+        data = read_source_dataset(source)
+        origin = source
+        try:
+            write_cache(data, source, cache, meta_path)
+        except OSError as error:
+            logger.warning('Could not write dataset cache %s: %s', cache, error)
+        else:
+            if lazy:
+                logger.info(
+                    'Partitioned %d rows from %s in %.3f s',
+                    len(data), origin, time.perf_counter() - start
+                )
+                return open_partitions(cache, meta_path)
+    logger.info(
+        'Loaded %d rows from %s in %.3f s',
+        len(data), origin, time.perf_counter() - start
+    )
+    data = index_by_date(data)
+    log_memory_usage(data)
+    return data
+
+
+def build_cube(data):
+    """
+    Builds the date x airport aggregate of the dataset.
+    Partitioned datasets are aggregated one year at a time
+    and appended rows on their own.
+    """
+    start = time.perf_counter()
+    if isinstance(data, SEGMENTED_DATASETS):
+        traffic_cube = None
+        for partition in data.iter_partitions():
+            if traffic_cube is None:
+                traffic_cube = TrafficCube(partition)
+            else:
+                traffic_cube = traffic_cube.extended(partition)
+    else:
+        traffic_cube = TrafficCube(data)
+    logger.info(
+        'Built %d x %d traffic cube (%.1f MiB) in %.3f s',
+        len(traffic_cube.dates), len(traffic_cube.airports),
+        traffic_cube.nbytes() / 2 ** 20, time.perf_counter() - start
+    )
+    return traffic_cube
+
+
+def build_airport_index(airport_states):
+    """
+    Takes airport -> state dictionary and returns it together
+    with state -> sorted list of its airports dictionary
+    """
+    state_airports = {}
+    for airport, state in airport_states.items():
+        state_airports.setdefault(state, []).append(airport)
+    state_airports = {
+        state: sorted(state_airports[state]) for state in sorted(state_airports)
+    }
+    return dict(airport_states), state_airports
+
+
+def make_options(values):
+    """
+    Returns dropdown options for the values
+    """
+    return [{'label': x, 'value': x} for x in values]
+
+
+class DatasetSnapshot:
+    """
+    Dataset together with everything precomputed from it.
+    Snapshots are never modified: ingestion builds a new one
+    and swaps it in, callbacks holding the previous one
+    keep a consistent view until they return.
+    """
+    def __init__(self, data, version, traffic_cube=None, deltas=()):
+        self.data = data
+        self.version = version
+        self.deltas = tuple(deltas)
+        self.first_date, self.last_date = get_date_bounds(data)
+        self.cube = build_cube(data) if traffic_cube is None else traffic_cube
+        self.monthly_cube = MonthlyCube(self.cube)
+        self.airport_states, self.state_airports = build_airport_index(
+            self.cube.airport_states
+        )
+        self.state_options = make_options(self.state_airports)
+        self.airport_options = make_options(sorted(self.airport_states))
+
+    def appended(self, delta, version, delta_name):
+        """
+        Returns a new snapshot with the delta rows appended, extending
+        the precomputed aggregates with the new days only. Rows and
+        aggregates of this snapshot are shared, not copied.
+        """
+        delta = delta[delta[c.DATE] > self.last_date]
+        if delta.empty:
+            return DatasetSnapshot(
+                self.data, self.version, self.cube, self.deltas + (delta_name,)
+            )
+        if isinstance(self.data, SEGMENTED_DATASETS):
+            data = self.data.appended(delta)
+        else:
+            data = AppendedDataset(self.data, delta)
+        return DatasetSnapshot(
+            data,
+            version,
+            self.cube.extended(delta),
+            self.deltas + (delta_name,)
+        )
+
+
+class DatasetSummary:
+    """
+    What the page layout needs from a snapshot: date bounds
+    and the airport index with the dropdown options
+    """
+    def __init__(self, version, first_date, last_date, airport_states):
+        self.version = version
+        self.first_date = pd.Timestamp(first_date)
+        self.last_date = pd.Timestamp(last_date)
+        self.airport_states, self.state_airports = build_airport_index(airport_states)
+        self.state_options = make_options(self.state_airports)
+        self.airport_options = make_options(sorted(self.airport_states))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        summary = cls.__new__(cls)
+        summary.version = snapshot.version
+        summary.first_date = snapshot.first_date
+        summary.last_date = snapshot.last_date
+        for name in ['airport_states', 'state_airports', 'state_options', 'airport_options']:
+            setattr(summary, name, getattr(snapshot, name))
+        return summary
+
+    @classmethod
+    def from_dict(cls, meta):
+        return cls(
+            meta['version'], meta['first_date'], meta['last_date'], meta['airport_states']
+        )
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'first_date': str(self.first_date.date()),
+            'last_date': str(self.last_date.date()),
+            'airport_states': self.airport_states
+        }
+
+
+def get_source_version(source=c.DATASET_FILE, meta_path=c.DATASET_CACHE_META_FILE):
+    """
+    Returns version of the dataset csv: the beginning of its md5 digest
+    """
+    meta = read_cache_meta(meta_path)
+    if meta is not None and 'source_md5' in meta:
+        digest = meta['source_md5']
+    else:
+        digest = get_file_digest(source)
+    return digest[:c.DATASET_VERSION_LENGTH]
+
+
+def get_delta_version(version, delta_path):
+    """
+    Returns version of a dataset after applying the delta file
+    """
+    digest = hashlib.md5(
+        (version + get_file_digest(delta_path)).encode()
+    ).hexdigest()
+    return digest[:c.DATASET_VERSION_LENGTH]
+
+
+def list_delta_files(directory=c.DATASET_DELTA_DIR):
+    """
+    Returns sorted names of delta files in the columnar store
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(x for x in os.listdir(directory) if x.endswith('.feather'))
+
+
+def apply_delta_files(snapshot, directory=c.DATASET_DELTA_DIR):
+    """
+    Returns the snapshot with all delta files it has not seen yet
+    appended, in the order of their names
+    """
+    for name in list_delta_files(directory):
+        if name in snapshot.deltas:
+            continue
+        path = os.path.join(directory, name)
+        start = time.perf_counter()
+        snapshot = snapshot.appended(
+            compact_dataset(pd.read_feather(path)),
+            get_delta_version(snapshot.version, path),
+            name
+        )
+        logger.info(
+            'Applied delta %s in %.3f s, dataset version %s ends on %s',
+            name, time.perf_counter() - start,
+            snapshot.version, snapshot.last_date.date()
+        )
+    return snapshot
+
+
+def load_snapshot():
+    """
+    Loads the dataset with the delta files ingested after it
+    """
+    snapshot = DatasetSnapshot(load_dataset(), get_source_version())
+    return apply_delta_files(snapshot)
+
+
+def get_snapshot():
+    """
+    Returns the current dataset snapshot, loading it on first use.
+    Callers should read it once per request and use that object throughout.
+    """
+    snapshot = getattr(pinned, 'snapshot', None) or current_snapshot
+    if snapshot is None:
+        snapshot = update_snapshot(lambda x: x)
+    return snapshot
+
+
+@contextlib.contextmanager
+def pinned_snapshot(snapshot):
+    """
+    Makes get_snapshot return the snapshot in the current thread, so that
+    all aggregations of a request read the same dataset version
+    """
+    previous = getattr(pinned, 'snapshot', None)
+    pinned.snapshot = snapshot
+    try:
+        yield snapshot
+    finally:
+        pinned.snapshot = previous
+
+
+def swap_snapshot(snapshot):
+    """
+    Makes the snapshot the one returned to all new requests
+    """
+    global current_snapshot, dataset, cube
+    current_snapshot = snapshot
+    dataset = snapshot.data
+    cube = snapshot.cube
+
+
+def update_snapshot(update):
+    """
+    Builds a new snapshot with update(current snapshot) and swaps it in.
+    Updates are serialized so that none of them is lost.
+    """
+    with snapshot_lock:
+        previous = current_snapshot
+        if previous is None:
+            previous = load_snapshot()
+        snapshot = update(previous)
+        if snapshot is not current_snapshot:
+            swap_snapshot(snapshot)
+            write_summary(DatasetSummary.from_snapshot(snapshot))
+        return snapshot
+
+
+def write_summary(summary, path=c.DATASET_SUMMARY_FILE):
+    """
+    Stores the summary of the current snapshot for starting workers.
+    Failures are logged, the summary is only a startup shortcut.
+    """
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        write_cache_meta(temporary_path, summary.to_dict())
+        os.replace(temporary_path, path)
+    except OSError as error:
+        logger.warning('Dataset summary not stored: %s', error)
+
+
+def get_summary(path=c.DATASET_SUMMARY_FILE):
+    """
+    Returns summary of the current snapshot. Until the dataset is
+    loaded it is read from the summary file, so that pages can be
+    served right after startup.
+    """
+    global stored_summary
+    snapshot = current_snapshot
+    if snapshot is None:
+        if stored_summary is None:
+            meta = read_cache_meta(path)
+            if meta is not None:
+                stored_summary = DatasetSummary.from_dict(meta)
+        if stored_summary is not None:
+            return stored_summary
+        snapshot = get_snapshot()
+    return DatasetSummary.from_snapshot(snapshot)
 
 
 def has_airport_data(data):
@@ -21,22 +686,27 @@ def has_airport_data(data):
 
 def filter_dataset_by_date(data, start_date, end_date):
     """
-    Filters dataset based on the start and end date
+    Filters dataset based on the start and end date.
+    Missing dates leave the range open on that side.
+    Datasets indexed by date are sliced using binary search,
+    partitioned datasets only load the years in the range
+    and appended rows are only added when the range reaches them.
     """
-    if start_date is None:
-        beginning_date = pd.to_datetime(get_date(data, min))
-    else:
-        beginning_date = pd.to_datetime(start_date)
-    if end_date is None:
-        ending_date = pd.to_datetime(get_date(data, max))
-    else:
-        ending_date = pd.to_datetime(end_date)
+    beginning_date = None if start_date is None else pd.to_datetime(start_date)
+    ending_date = None if end_date is None else pd.to_datetime(end_date)
 
-    filtered_dataset = data[
-        data[c.DATE].ge(beginning_date) &
-        data[c.DATE].le(ending_date)
-    ]
-    return filtered_dataset
+    if isinstance(data, SEGMENTED_DATASETS):
+        data = data.load_range(beginning_date, ending_date)
+
+    if is_indexed_by_date(data):
+        return data.iloc[data.index.slice_indexer(beginning_date, ending_date)]
+
+    mask = np.ones(len(data), dtype=bool)
+    if beginning_date is not None:
+        mask &= data[c.DATE].ge(beginning_date).values
+    if ending_date is not None:
+        mask &= data[c.DATE].le(ending_date).values
+    return data[mask]
 
 
 def filter_dataset(data, airports=None, states=None, start_date=None, end_date=None):
@@ -63,21 +733,93 @@ def filter_dataset(data, airports=None, states=None, start_date=None, end_date=N
     return filtered_dataset
 
 
+def get_date_slices(data, start_date=None, end_date=None, days=c.EXPORT_CHUNK_DAYS):
+    """
+    Returns first and last dates of consecutive slices of at most
+    days days covering the period within the dataset
+    """
+    first_date, last_date = get_date_bounds(data)
+    if start_date is not None:
+        first_date = max(first_date, pd.to_datetime(start_date))
+    if end_date is not None:
+        last_date = min(last_date, pd.to_datetime(end_date))
+    return [
+        (slice_start, min(slice_start + timedelta(days=days - 1), last_date))
+        for slice_start in pd.date_range(first_date, last_date, freq='{}D'.format(days))
+    ]
+
+
+def iter_filtered_dataset(data, airports=None, states=None, start_date=None,
+                          end_date=None, days=c.EXPORT_CHUNK_DAYS, filter_rows=None):
+    """
+    Yields the filtered dataset as consecutive slices of at most
+    days days, so that only one slice is in memory at a time.
+    filter_rows(airports, states, start_date, end_date) reads each
+    slice, filter_dataset over data by default.
+    """
+    if filter_rows is None:
+        filter_rows = functools.partial(filter_dataset, data)
+    for slice_start, slice_end in get_date_slices(data, start_date, end_date, days):
+        filtered = filter_rows(airports, states, slice_start, slice_end)
+        if len(filtered):
+            yield filtered
+
+
+def normalize_filter(airports=None, states=None, start_date=None, end_date=None):
+    """
+    Returns a hashable key describing the filters: sorted airports
+    and states, dates clipped to the dataset with missing ones
+    replaced by the dataset bounds, and the dataset version
+    """
+    snapshot = get_snapshot()
+    first_date, last_date = snapshot.first_date, snapshot.last_date
+    start = first_date if start_date is None else max(
+        pd.to_datetime(start_date), first_date
+    )
+    end = last_date if end_date is None else min(
+        pd.to_datetime(end_date), last_date
+    )
+    return (
+        tuple(sorted(airports or ())),
+        tuple(sorted(states or ())),
+        start,
+        end,
+        snapshot.version
+    )
+
+
+def get_date_bounds(data):
+    """
+    Returns first and last date of a dataset.
+    Datasets indexed by date answer it without scanning.
+    """
+    if isinstance(data, SEGMENTED_DATASETS):
+        return data.first_date, data.last_date
+    if is_indexed_by_date(data):
+        return data.index[0], data.index[-1]
+    return data[c.DATE].min(), data[c.DATE].max()
+
+
 def get_date(data, func):
     """
     Returns first (min) or last (max) date from a dataset
     """
-    return pd.to_datetime(
-        str(func(data[c.DATE].unique()))
-    ).strftime('%m/%d/%Y')
+    return format_date(func(get_date_bounds(data)))
+
+
+def format_date(date):
+    """
+    Returns the date in the format of the date picker
+    """
+    return date.strftime('%m/%d/%Y')
 
 
 def get_last_date(data):
     """
     Returns last (max) date + 1 day from a dataset
     """
-    return pd.to_datetime(
-        str(max(data[c.DATE].unique()) + np.timedelta64(1, 'D'))
+    return (
+        get_date_bounds(data)[1] + timedelta(days=1)
     ).strftime('%m/%d/%Y')
 
 
@@ -95,6 +837,7 @@ def get_flight_columns(ifr_movements):
     return flight_columns
 
 
+@instrumentation.timed_phase('aggregate')
 def get_number_of_flights(data, flight_columns):
     """
     Takes a dataset and flight columns (arrival, departure or total)
@@ -110,6 +853,7 @@ def get_number_of_flights(data, flight_columns):
     return pivot
 
 
+@instrumentation.timed_phase('aggregate')
 def get_top_flight_airports(data, source='NM'):
     """
     Returns top 5 countries with daily average flights
@@ -122,7 +866,8 @@ def get_top_flight_airports(data, source='NM'):
         flight_column = c.NM_TOTAL_FLIGHTS
     pivot = pd.pivot_table(
         data, values=flight_column, index=c.AIRPORT_NAME,
-        aggfunc=np.mean
+        aggfunc=np.mean,
+        observed=True
     )
     if not pivot.empty:
         pivot = pivot.reset_index()
@@ -135,6 +880,7 @@ def get_top_flight_airports(data, source='NM'):
         return pd.DataFrame(columns=[c.AIRPORT_NAME, c.DAILY_AVERAGE])
 
 
+@instrumentation.timed_phase('aggregate')
 def get_daily_average_per_state(data, flight_columns):
     """
     Takes a dataset and flight columns (arrival, departure or total)
@@ -144,18 +890,21 @@ def get_daily_average_per_state(data, flight_columns):
     if has_airport_data(data):
         pivot = pd.pivot_table(
             data, values=flight_columns, index=c.STATE_NAME,
-            aggfunc=np.sum
+            aggfunc=np.sum,
+            observed=True
         )
     else:
         pivot = pd.pivot_table(
             data, values=flight_columns[0], index=c.STATE_NAME,
-            aggfunc=np.sum
+            aggfunc=np.sum,
+            observed=True
         )
     pivot = pivot.reset_index()
     pivot = pivot.sort_values(by=c.STATE_NAME)
     return pivot
 
 
+@instrumentation.timed_phase('aggregate')
 def get_average_per_month(data, flight_columns):
     """
     Takes a dataset and flight columns (arrival, departure or total)
@@ -164,13 +913,275 @@ def get_average_per_month(data, flight_columns):
     """
     pivot = pd.pivot_table(
         data, values=flight_columns, index=[c.MONTH_MON, c.MONTH_NUM],
-        aggfunc=np.mean
+        aggfunc=np.mean,
+        observed=True
     )
     pivot = pivot.sort_values(by=c.MONTH_NUM)
     pivot = pivot.reset_index()
     return pivot
 
 
+@instrumentation.timed_phase('aggregate')
+def query_number_of_flights(flight_columns, airports=None, states=None,
+                            start_date=None, end_date=None):
+    """
+    Same result as get_number_of_flights over the filtered dataset,
+    answered from the traffic cube
+    """
+    cube = get_snapshot().cube
+    start, stop = cube.date_range(start_date, end_date)
+    mask = cube.airport_mask(airports, states)
+    has_rows = cube.daily_counts(c.NM_TOTAL_FLIGHTS, start, stop, mask) > 0
+    result = pd.DataFrame({c.DATE: cube.dates[start:stop][has_rows]})
+    for column in flight_columns:
+        result[column] = cube.daily_sums(column, start, stop, mask)[has_rows]
+    return result
+
+
+def get_comparison_groups(cube, airports=None, states=None,
+                          limit=c.MAX_COMPARED_SERIES):
+    """
+    Returns names of the compared entities, the selected airports or, when
+    no airport is selected, the selected (or all) states, together with
+    the group of every airport of the cube (-1 for airports left out).
+    At most limit entities are compared, in the order of their names
+    whatever the order of the airports in the cube.
+    """
+    mask = cube.airport_mask(airports, states)
+    if airports:
+        names = sorted(cube.airports[mask])[:limit]
+        group_codes = pd.Index(names).get_indexer(cube.airports)
+    else:
+        airport_states = cube.states[cube.airport_state_codes]
+        names = list(cube.states[np.unique(cube.airport_state_codes[mask])])[:limit]
+        group_codes = np.where(mask, pd.Index(names).get_indexer(airport_states), -1)
+    return names, group_codes
+
+
+@instrumentation.timed_phase('aggregate')
+def query_flights_by_group(flight_column, airports=None, states=None,
+                           start_date=None, end_date=None):
+    """
+    Returns daily number of flights of every selected airport, or of every
+    state when no airport is selected, as a frame with a date column and
+    one column per entity. All entities are aggregated in one product of
+    the traffic cube. Days without rows of an entity are NaN, days without
+    rows of any entity and entities without rows are left out.
+    """
+    cube = get_snapshot().cube
+    start, stop = cube.date_range(start_date, end_date)
+    names, group_codes = get_comparison_groups(cube, airports, states)
+    membership = cube.group_membership(group_codes, len(names))
+    rows = cube.daily_group_values(
+        cube.counts[c.NM_TOTAL_FLIGHTS], start, stop, membership
+    ) > 0
+    values = cube.daily_group_values(cube.sums[flight_column], start, stop, membership)
+    values[~rows] = np.nan
+    has_rows = rows.any(axis=1)
+    observed = rows.any(axis=0)
+    result = pd.DataFrame(
+        values[has_rows][:, observed], columns=np.array(names, dtype=object)[observed]
+    )
+    result.insert(0, c.DATE, cube.dates[start:stop][has_rows])
+    return result
+
+
+@instrumentation.timed_phase('aggregate')
+def query_monthly_averages(flight_columns, airports=None, states=None,
+                           start_date=None, end_date=None, by_year=True):
+    """
+    Returns daily average flights of every month of the period, answered
+    from the monthly cube. When by_year is False months of all years are
+    combined, the same result as get_average_per_month over the filtered
+    dataset.
+    """
+    snapshot = get_snapshot()
+    monthly_cube = snapshot.monthly_cube
+    start, stop = snapshot.cube.date_range(start_date, end_date)
+    mask = snapshot.cube.airport_mask(airports, states)
+    first, last = monthly_cube.month_range(start, stop)
+    years = monthly_cube.years[first:last]
+    month_numbers = monthly_cube.month_numbers[first:last]
+    rows = monthly_cube.monthly_counts(c.NM_TOTAL_FLIGHTS, start, stop, mask)
+    sums = {
+        x: monthly_cube.monthly_sums(x, start, stop, mask) for x in flight_columns
+    }
+    counts = {
+        x: monthly_cube.monthly_counts(x, start, stop, mask) for x in flight_columns
+    }
+    if not by_year:
+        observed = np.unique(month_numbers[rows > 0])
+        sums = {
+            x: np.bincount(month_numbers, weights=values, minlength=13)[observed]
+            for x, values in sums.items()
+        }
+        counts = {
+            x: np.bincount(month_numbers, weights=values, minlength=13)[observed]
+            for x, values in counts.items()
+        }
+        month_numbers = observed
+    else:
+        observed = rows > 0
+        years = years[observed]
+        month_numbers = month_numbers[observed]
+        sums = {x: values[observed] for x, values in sums.items()}
+        counts = {x: values[observed] for x, values in counts.items()}
+
+    result = pd.DataFrame({
+        c.MONTH_MON: np.array([c.MONTH_NAMES[x - 1] for x in month_numbers], dtype=object),
+        c.MONTH_NUM: month_numbers
+    })
+    if by_year:
+        result.insert(0, c.YEAR, years)
+    for column in flight_columns:
+        result[column] = np.where(
+            counts[column] > 0, sums[column] / np.maximum(counts[column], 1), np.nan
+        )
+    return result
+
+
+def get_top_indices(values, number):
+    """
+    Returns indices of the number largest values in descending order.
+    Only the selected values are sorted.
+    """
+    number = min(number, len(values))
+    if number <= 0:
+        return np.array([], dtype=int)
+    if number < len(values):
+        indices = np.argpartition(-values, number - 1)[:number]
+    else:
+        indices = np.arange(len(values))
+    return indices[np.argsort(-values[indices], kind='stable')]
+
+
+def get_top_airports_value_column(statistic=config.TOP_AIRPORTS_STATISTIC):
+    """
+    Returns name of the value column of the top airports tables
+    """
+    if statistic == 'total':
+        return c.TOTAL_FLIGHTS
+    return c.DAILY_AVERAGE
+
+
+@instrumentation.timed_phase('aggregate')
+def query_top_airports(airports=None, states=None, start_date=None, end_date=None,
+                       number=config.TOP_AIRPORTS,
+                       movement=config.TOP_AIRPORTS_MOVEMENT,
+                       statistic=config.TOP_AIRPORTS_STATISTIC):
+    """
+    Returns top airports of the NM and airport sources as a dictionary:
+    source -> airports with their daily average (or total) flights.
+    Both sources are ranked in one pass over the traffic cube.
+    movement is total, arrival or departure,
+    statistic is average or total.
+    """
+    cube = get_snapshot().cube
+    columns = [c.TOP_AIRPORTS_COLUMNS[x][movement] for x in c.TOP_AIRPORTS_SOURCES]
+    start, stop = cube.date_range(start_date, end_date)
+    sums = np.stack([cube.range_sums(x, start, stop) for x in columns])
+    counts = np.stack([cube.range_counts(x, start, stop) for x in columns])
+    reported = (counts > 0) & cube.airport_mask(airports, states)
+    if statistic == 'total':
+        values = sums
+    else:
+        values = sums / np.maximum(counts, 1)
+    values = np.where(reported, values, -np.inf)
+
+    value_column = get_top_airports_value_column(statistic)
+    result = {}
+    for source, row, row_reported in zip(c.TOP_AIRPORTS_SOURCES, values, reported):
+        top = get_top_indices(row, min(number, int(row_reported.sum())))
+        result[source] = pd.DataFrame({
+            c.AIRPORT_NAME: cube.airports[top],
+            value_column: row[top]
+        })
+    return result
+
+
+def query_top_flight_airports(source='NM', airports=None, states=None,
+                              start_date=None, end_date=None):
+    """
+    Same result as get_top_flight_airports over the filtered dataset,
+    answered from the traffic cube
+    """
+    return query_top_airports(
+        airports, states, start_date, end_date,
+        number=5, movement='total', statistic='average'
+    )[source]
+
+
+@instrumentation.timed_phase('aggregate')
+def query_daily_average_per_state(flight_columns, airports=None, states=None,
+                                  start_date=None, end_date=None):
+    """
+    Same result as get_daily_average_per_state over the filtered dataset,
+    answered from the traffic cube
+    """
+    cube = get_snapshot().cube
+    start, stop = cube.date_range(start_date, end_date)
+    mask = cube.airport_mask(airports, states)
+    counts = cube.per_state(
+        cube.range_counts(c.NM_TOTAL_FLIGHTS, start, stop), mask
+    )
+    observed = counts > 0
+    result = pd.DataFrame({c.STATE_NAME: cube.states[observed]})
+    for column in flight_columns:
+        result[column] = cube.per_state(
+            cube.range_sums(column, start, stop), mask
+        )[observed]
+    return result
+
+
+def get_state_options(airports=None):
+    """
+    Returns dropdown options with states of the airports,
+    or with all states when no airport is selected
+    """
+    summary = get_summary()
+    if not airports:
+        return summary.state_options
+    return make_options(sorted({
+        summary.airport_states[x] for x in airports
+        if x in summary.airport_states
+    }))
+
+
+def get_airport_options(states=None):
+    """
+    Returns dropdown options with airports of the states,
+    or with all airports when no state is selected
+    """
+    summary = get_summary()
+    if not states:
+        return summary.airport_options
+    return make_options(sorted(
+        x for state in set(states)
+        for x in summary.state_airports.get(state, [])
+    ))
+
+
+@instrumentation.timed_phase('aggregate')
+def query_state_daily_averages(flight_columns, start_date=None, end_date=None):
+    """
+    Returns dataframe with states and their average number of
+    daily flights over the period, taking into account the days
+    for which the dataset has data
+    """
+    cube = get_snapshot().cube
+    start, stop = cube.date_range(start_date, end_date)
+    mask = cube.airport_mask()
+    number_of_days = np.count_nonzero(
+        cube.daily_counts(c.NM_TOTAL_FLIGHTS, start, stop, mask)
+    )
+    result = query_daily_average_per_state(
+        flight_columns, start_date=start_date, end_date=end_date
+    )
+    if number_of_days:
+        result[flight_columns] = result[flight_columns] / number_of_days
+    return result
+
+
 def get_list_of_states(data):
     """
     Returns a list of states from the dataset
@@ -183,3 +1194,19 @@ def get_list_of_airports(data):
     Returns a list of states from the dataset
     """
     return data[c.AIRPORT_NAME].unique()
+
+
+snapshot_lock = threading.Lock()
+pinned = threading.local()
+current_snapshot = None
+stored_summary = None
+dataset = None
+cube = None
+if config.PRELOAD_DATASET:
+    update_snapshot(lambda x: x)
+
+
+if __name__ == '__main__':
+    usage = get_memory_usage(get_snapshot().data)
+    print(usage.to_string())
+    print('Total: {:.1f} MiB'.format(usage.sum() / 2 ** 20))
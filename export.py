@@ -0,0 +1,128 @@
+"""
+Download of the rows behind the current view.
+
+/export streams the filtered dataset as CSV (in the format of the
+EUROCONTROL file, so exports can be ingested again) or Parquet. Rows
+are read one date slice at a time and every slice is written to the
+response as soon as it is encoded, so memory use does not depend on
+the length of the period. It takes the filters of the API.
+"""
+import io
+from flask import Response, request, stream_with_context
+import backends
+import constants as c
+import data as ds
+from api import get_filters
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class StreamBuffer(io.RawIOBase):
+    """
+    Write only file collecting bytes until they are drained
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, value):
+        self.chunks.append(bytes(value))
+        self.position += len(value)
+        return len(value)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        value = b''.join(self.chunks)
+        self.chunks = []
+        return value
+
+
+def get_parquet_schema():
+    """
+    Returns the schema of exported files: names are plain strings and
+    counters are not downcast, so that all slices share one schema
+    """
+    import pyarrow as pa
+
+    fields = []
+    for column in ds.DATASET_COLUMNS:
+        if column == c.DATE:
+            fields.append(pa.field(column, pa.timestamp('ns')))
+        elif column in ds.CATEGORICAL_COLUMNS:
+            fields.append(pa.field(column, pa.string()))
+        elif column in c.AIRPORT_FLIGHT_COLUMNS:
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.int64()))
+    return pa.schema(fields)
+
+
+def iter_csv(slices):
+    yield (';'.join(ds.DATASET_COLUMNS) + '\n').encode()
+    for data in slices:
+        yield data[ds.DATASET_COLUMNS].to_csv(
+            sep=';', header=False, index=False, date_format='%d/%m/%Y'
+        ).encode()
+
+
+def iter_parquet(slices):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    buffer = StreamBuffer()
+    schema = get_parquet_schema()
+    writer = pq.ParquetWriter(buffer, schema)
+    for data in slices:
+        writer.write_table(pa.Table.from_pandas(
+            data[ds.DATASET_COLUMNS], schema=schema, preserve_index=False
+        ))
+        yield buffer.drain()
+    writer.close()
+    yield buffer.drain()
+
+
+def export():
+    """
+    Streams the filtered dataset in the requested format
+    """
+    file_format = request.args.get('format', 'csv')
+    if file_format not in FORMATS:
+        return Response('format must be csv or parquet', status=400)
+    try:
+        filters = get_filters()
+    except ValueError as error:
+        return Response(str(error), status=400)
+
+    snapshot = ds.get_snapshot()
+    with ds.pinned_snapshot(snapshot):
+        backend = backends.get_backend()
+    slices = backend.iter_filtered_dataset(**filters)
+    if file_format == 'csv':
+        body = iter_csv(slices)
+    else:
+        body = iter_parquet(slices)
+    mimetype, extension = FORMATS[file_format]
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': 'attachment; filename=airport_traffic_{}.{}'.format(
+                snapshot.version, extension
+            )
+        }
+    )
+
+
+def init_app(server):
+    """
+    Registers the export route on the Flask server
+    """
+    server.add_url_rule('/export', 'export', export)
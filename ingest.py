@@ -0,0 +1,88 @@
+"""
+Incremental ingestion of new EUROCONTROL data.
+
+    python ingest.py path/to/Airport_Traffic.csv
+
+stores the days missing from the current dataset as a delta file of the
+columnar store. Running workers pick delta files up with a background
+watcher and swap in a new dataset snapshot without restarting.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import constants as c
+import data as ds
+
+logger = logging.getLogger(__name__)
+
+watcher_pid = None
+
+
+def write_delta(path, directory=c.DATASET_DELTA_DIR):
+    """
+    Parses a csv with EUROCONTROL data and stores the days after the
+    end of the current dataset as a delta file.
+    Returns path of the delta file or None if there is nothing new.
+    """
+    snapshot = ds.get_snapshot()
+    delta = ds.read_source_dataset(path)
+    delta = delta[delta[c.DATE] > snapshot.last_date]
+    if delta.empty:
+        logger.info('%s has no days after %s', path, snapshot.last_date.date())
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    first_date, last_date = ds.get_date_bounds(delta)
+    delta_path = os.path.join(directory, '{:%Y%m%d}-{:%Y%m%d}.feather'.format(
+        first_date, last_date
+    ))
+    temporary_path = '{}.{}.tmp'.format(delta_path, os.getpid())
+    delta.reset_index(drop=True).to_feather(temporary_path)
+    os.replace(temporary_path, delta_path)
+    logger.info('Stored %d new rows in %s', len(delta), delta_path)
+    return delta_path
+
+
+def ingest(path):
+    """
+    Stores the new days of the csv and swaps them into this process.
+    Returns the current snapshot.
+    """
+    write_delta(path)
+    return ds.update_snapshot(ds.apply_delta_files)
+
+
+def watch_deltas(interval):
+    """
+    Applies new delta files every interval seconds
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            ds.update_snapshot(ds.apply_delta_files)
+        except Exception:
+            logger.exception('Could not apply delta files')
+
+
+def start_watcher(interval=c.DELTA_POLL_INTERVAL):
+    """
+    Starts the delta watcher thread once per process.
+    Threads do not survive forking, so preloaded gunicorn workers
+    have to call it themselves, e.g. when serving the first request.
+    """
+    global watcher_pid
+    if watcher_pid == os.getpid():
+        return
+    watcher_pid = os.getpid()
+    threading.Thread(
+        target=watch_deltas, args=(interval,),
+        name='delta-watcher', daemon=True
+    ).start()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    for source in sys.argv[1:]:
+        ingest(source)
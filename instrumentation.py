@@ -0,0 +1,300 @@
+"""
+Latency instrumentation of the dashboard callbacks.
+
+When INSTRUMENTATION is enabled every decorated callback is timed with
+its phases (aggregate, smoothing, figure, serialization), the
+response size is measured, Server-Timing headers are added to
+_dash-update-component responses and histograms are exposed in the
+Prometheus text format on /metrics, along with the hit/miss counters
+of the named LRU caches. Metrics are kept per process.
+When disabled, the decorator returns the callback unchanged and phases
+are a shared no-op context manager.
+
+When RECORD_CALLBACKS is set to a file, the payloads of callback
+requests are appended to it, one JSON document per line, to be
+replayed by benchmarks.load_test.
+"""
+import contextlib
+import functools
+import json
+import threading
+import time
+from flask import Response, g, has_request_context, request
+import caching
+import config
+
+ENABLED = config.INSTRUMENTATION
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+SIZE_BUCKETS = (
+    1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216
+)
+NO_PHASE = contextlib.nullcontext()
+METRICS = {
+    'dash_callback_duration_seconds': (
+        'Time spent in dashboard callbacks', DURATION_BUCKETS
+    ),
+    'dash_callback_phase_duration_seconds': (
+        'Time spent in phases of dashboard callbacks', DURATION_BUCKETS
+    ),
+    'dash_callback_response_bytes': (
+        'Size of uncompressed callback responses', SIZE_BUCKETS
+    ),
+}
+CACHE_METRICS = {
+    'cache_hits_total': ('Lookups served from an LRU cache', 'counter', 'hits'),
+    'cache_misses_total': ('Lookups computed by an LRU cache', 'counter', 'misses'),
+    'cache_entries': ('Entries held in an LRU cache', 'gauge', 'size'),
+}
+
+
+class Histogram:
+    """
+    Cumulative histogram with the sum and count of observations
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class PhaseRecorder:
+    """
+    Durations of the phases of one callback call. A phase running in
+    several threads at once, or nested in itself, counts the wall-clock
+    time during which at least one of them runs: the union of their
+    intervals.
+    """
+    def __init__(self):
+        self.durations = {}
+        self.running = {}
+        self.started = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def record(self, name):
+        with self.lock:
+            if not self.running.get(name):
+                self.started[name] = time.perf_counter()
+            self.running[name] = self.running.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.running[name] -= 1
+                if not self.running[name]:
+                    self.durations[name] = (
+                        self.durations.get(name, 0.0)
+                        + time.perf_counter() - self.started.pop(name)
+                    )
+
+
+histograms = {}
+histograms_lock = threading.Lock()
+recording_lock = threading.Lock()
+local = threading.local()
+
+
+def observe(metric, labels, value):
+    """
+    Adds an observation to the histogram of the metric with the labels
+    """
+    key = (metric, tuple(sorted(labels.items())))
+    with histograms_lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(METRICS[metric][1])
+        histogram.observe(value)
+
+
+def phase(name):
+    """
+    Returns context manager timing a phase of the running callback.
+    Time during which phases with the same name overlap is counted once.
+    """
+    if not ENABLED:
+        return NO_PHASE
+    recorder = getattr(local, 'recorder', None)
+    if recorder is None:
+        return NO_PHASE
+    return recorder.record(name)
+
+
+def bind_phases(function):
+    """
+    Returns the function recording its phases in the callback running
+    in the current thread, to be called from another thread. Phases
+    running concurrently in several threads add up the time during
+    which at least one of them runs.
+    """
+    recorder = getattr(local, 'recorder', None)
+    if recorder is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        local.recorder = recorder
+        try:
+            return function(*args, **kwargs)
+        finally:
+            local.recorder = None
+    return wrapper
+
+
+def timed_phase(name):
+    """
+    Decorator timing every call of a function as a phase
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_callback(function):
+    """
+    Decorator timing a dashboard callback and its phases
+    """
+    if not ENABLED:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        local.recorder = recorder = PhaseRecorder()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            local.recorder = None
+            name = function.__name__
+            observe('dash_callback_duration_seconds', {'callback': name}, duration)
+            for phase_name, phase_duration in recorder.durations.items():
+                observe(
+                    'dash_callback_phase_duration_seconds',
+                    {'callback': name, 'phase': phase_name},
+                    phase_duration
+                )
+            if has_request_context():
+                g.callback_name = name
+                g.callback_duration = duration
+                g.callback_phases = recorder.durations
+    return wrapper
+
+
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def finish_callback_request(response):
+    """
+    Measures serialization and size of callback responses
+    and adds the Server-Timing header
+    """
+    name = g.get('callback_name')
+    if name is None or not request.path.endswith('_dash-update-component'):
+        return response
+    serialization = max(
+        time.perf_counter() - g.request_start - g.callback_duration, 0.0
+    )
+    observe(
+        'dash_callback_phase_duration_seconds',
+        {'callback': name, 'phase': 'serialization'},
+        serialization
+    )
+    # Responses are compressed before this hook runs, their size before
+    # compression is kept by serialization.measure_response
+    size = g.get('response_bytes')
+    if size is None and not response.is_streamed:
+        size = response.calculate_content_length() or 0
+    if size is not None:
+        observe('dash_callback_response_bytes', {'callback': name}, size)
+    timings = dict(g.callback_phases, callback=g.callback_duration)
+    timings['serialization'] = serialization
+    response.headers['Server-Timing'] = ', '.join(
+        '{};dur={:.2f}'.format(x, duration * 1000) for x, duration in timings.items()
+    )
+    return response
+
+
+def record_callback_request():
+    """
+    Appends the payload of a callback request to RECORD_CALLBACKS
+    """
+    if not request.path.endswith('_dash-update-component'):
+        return
+    line = json.dumps(request.get_json(silent=True), separators=(',', ':')) + '\n'
+    with recording_lock, open(config.RECORD_CALLBACKS, 'a') as file:
+        file.write(line)
+
+
+def format_labels(labels):
+    return ','.join('{}="{}"'.format(key, value) for key, value in labels)
+
+
+def render_metrics():
+    """
+    Returns the histograms and cache counters in the Prometheus text format
+    """
+    with histograms_lock:
+        items = sorted(histograms.items())
+        lines = []
+        for metric, (description, _) in METRICS.items():
+            lines.append('# HELP {} {}'.format(metric, description))
+            lines.append('# TYPE {} histogram'.format(metric))
+            for (name, labels), histogram in items:
+                if name != metric:
+                    continue
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append('{}_bucket{{{}}} {}'.format(
+                        metric, format_labels(labels + (('le', bound),)), count
+                    ))
+                lines.append('{}_bucket{{{}}} {}'.format(
+                    metric, format_labels(labels + (('le', '+Inf'),)), histogram.count
+                ))
+                lines.append('{}_sum{{{}}} {}'.format(
+                    metric, format_labels(labels), histogram.sum
+                ))
+                lines.append('{}_count{{{}}} {}'.format(
+                    metric, format_labels(labels), histogram.count
+                ))
+    stats = sorted((name, cache.info()) for name, cache in list(caching.caches.items()))
+    for metric, (description, kind, key) in CACHE_METRICS.items():
+        lines.append('# HELP {} {}'.format(metric, description))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        for name, info in stats:
+            lines.append('{}{{{}}} {}'.format(
+                metric, format_labels((('cache', name),)), info[key]
+            ))
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(server):
+    """
+    Registers request hooks and the /metrics route on the Flask server
+    """
+    if config.RECORD_CALLBACKS:
+        server.before_request(record_callback_request)
+    if not ENABLED:
+        return
+    server.before_request(start_request_timer)
+    server.after_request(finish_callback_request)
+    server.add_url_rule(
+        '/metrics', 'metrics',
+        lambda: Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+    )
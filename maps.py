@@ -0,0 +1,155 @@
+"""
+Choropleth map of the states.
+
+The simplified map of the states is served once as /geojson/<digest>.json
+with a long cache lifetime and figures reference it by URL: plotly.js
+downloads it once per page instead of with every map response.
+"""
+import functools
+import hashlib
+import json
+import os
+import numpy as np
+import plotly.graph_objects as go
+from flask import Response, abort
+import constants as c
+import data as ds
+import instrumentation
+import serialization
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+GEOJSON_URL = '/geojson/{}.json'
+geojson_documents = {}
+
+
+def simplify_ring(ring, tolerance):
+    """
+    Snaps coordinates of a polygon ring to a grid of the given size
+    (in degrees) and drops points falling into the same grid cell
+    as the previous one. Rings that would degenerate are kept as they are.
+    """
+    points = np.round(np.asarray(ring, dtype=float) / tolerance) * tolerance
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[keep]
+    if len(points) < 4:
+        return ring
+    return np.round(points, 4).tolist()
+
+
+def simplify_geometry(geometry, tolerance):
+    """
+    Simplifies every ring of a Polygon or MultiPolygon geometry
+    """
+    if geometry['type'] == 'Polygon':
+        coordinates = [simplify_ring(x, tolerance) for x in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        coordinates = [
+            [simplify_ring(x, tolerance) for x in polygon]
+            for polygon in geometry['coordinates']
+        ]
+    else:
+        coordinates = geometry['coordinates']
+    return {'type': geometry['type'], 'coordinates': coordinates}
+
+
+def load_geojson(path, states, tolerance=c.MAP_SIMPLIFY_TOLERANCE):
+    """
+    Loads the map of Europe keeping only the states present in the
+    dataset, with geometries simplified to the displayed resolution
+    and properties other than the state name removed
+    """
+    with open(path) as file:
+        countries = json.load(file)
+    features = [
+        {
+            'type': 'Feature',
+            'properties': {'NAME': x['properties']['NAME']},
+            'geometry': simplify_geometry(x['geometry'], tolerance)
+        }
+        for x in countries['features'] if x['properties']['NAME'] in states
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def register_geojson(geojson):
+    """
+    Stores the encoded map for the geojson route and returns its URL,
+    which changes with the content
+    """
+    document = json.dumps(geojson, separators=(',', ':')).encode()
+    digest = hashlib.md5(document).hexdigest()[:16]
+    geojson_documents[digest] = document
+    return GEOJSON_URL.format(digest)
+
+
+def build_map_skeleton(geojson_url):
+    """
+    Builds the choropleth figure once, as a dictionary
+    without locations and values
+    """
+    figure = go.Figure(
+        go.Choropleth(
+            geojson=geojson_url,
+            featureidkey='properties.NAME',
+            colorscale='Viridis',
+            zmin=0,
+            hovertemplate='<b>%{location}</b><br>%{z:,.0f}<extra></extra>'
+        ),
+        layout=go.Layout(
+            margin={'r': 0, 't': 20, 'l': 0, 'b': 30}
+        )
+    )
+    figure.update_geos(scope='europe', fitbounds='locations', visible=False)
+    return figure.to_dict()
+
+
+@functools.lru_cache(maxsize=2)
+def get_map_skeleton(states):
+    """
+    Returns the map skeleton for the tuple of states,
+    built on first use
+    """
+    return build_map_skeleton(register_geojson(load_geojson(
+        os.path.join(APP_DIR, c.GEOJSON_FILE), states
+    )))
+
+
+@instrumentation.timed_phase('figure')
+def make_map_figure(skeleton, locations, values, title):
+    """
+    Fills the map skeleton with values of the locations.
+    Only the trace and layout dictionaries are copied,
+    the geometries are shared with the skeleton.
+    """
+    values = serialization.round_values(values)
+    trace = dict(
+        skeleton['data'][0],
+        locations=list(locations),
+        z=values,
+        zmax=values.max() if len(values) else 1,
+        colorbar={'title': {'text': title}}
+    )
+    return {'data': [trace], 'layout': skeleton['layout']}
+
+
+def serve_geojson(digest):
+    """
+    Returns the map registered under the digest. Workers that have not
+    drawn a map yet build the one of the current dataset first.
+    """
+    if digest not in geojson_documents:
+        get_map_skeleton(tuple(ds.get_snapshot().state_airports))
+    if digest not in geojson_documents:
+        abort(404)
+    return Response(
+        geojson_documents[digest], mimetype='application/json',
+        headers={'Cache-Control': 'public, max-age=31536000, immutable'}
+    )
+
+
+def init_app(server):
+    """
+    Registers the geojson route on the Flask server
+    """
+    server.add_url_rule('/geojson/<digest>.json', 'geojson', serve_geojson)
@@ -0,0 +1,149 @@
+"""
+Request scoped computation of the dashboard aggregates.
+
+A dashboard update reads the dataset snapshot once and runs the
+independent aggregations of its outputs (daily series, monthly
+averages, top airports, per state values) concurrently on a thread
+pool of the worker process. NumPy and pandas release the GIL in their
+heavy loops, so aggregations over long periods overlap. The pool size
+is set by PIPELINE_THREADS, with 1 the aggregations run one after
+another in the calling thread.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import config
+import constants as c
+import data as ds
+import instrumentation
+import series
+
+executor = None
+executor_pid = None
+executor_lock = threading.Lock()
+
+
+def get_executor(threads=config.PIPELINE_THREADS):
+    """
+    Returns the thread pool of the current process. Pools are not
+    reused after forking, e.g. by preloaded gunicorn workers.
+    """
+    global executor, executor_pid
+    with executor_lock:
+        if executor is None or executor_pid != os.getpid():
+            executor = ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix='pipeline'
+            )
+            executor_pid = os.getpid()
+        return executor
+
+
+def run(tasks, threads=config.PIPELINE_THREADS):
+    """
+    Takes a dictionary name -> (function, args) and returns name -> result.
+    All tasks read the same dataset snapshot. Exceptions are raised
+    to the caller.
+    """
+    snapshot = ds.get_snapshot()
+
+    def pinned(function):
+        def wrapper(*args):
+            with ds.pinned_snapshot(snapshot):
+                return function(*args)
+        return wrapper
+
+    if threads <= 1 or len(tasks) <= 1:
+        return {
+            name: pinned(function)(*args) for name, (function, args) in tasks.items()
+        }
+    pool = get_executor(threads)
+    futures = {
+        name: pool.submit(instrumentation.bind_phases(pinned(function)), *args)
+        for name, (function, args) in tasks.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def get_seasonal_data(seasonal_mode, flight_columns, airports=None, states=None,
+                      start_date=None, end_date=None):
+    """
+    Returns monthly averages for the seasonal chart mode. Compared to the
+    previous year, values of the same months one year earlier are added
+    as columns with PREVIOUS_YEAR_SUFFIX.
+    """
+    graph_data = ds.query_monthly_averages(
+        flight_columns,
+        airports=airports,
+        states=states,
+        start_date=start_date,
+        end_date=end_date,
+        by_year=seasonal_mode != c.SEASONAL_MODE_COMBINED
+    )
+    if seasonal_mode != c.SEASONAL_MODE_PREVIOUS:
+        return graph_data
+
+    previous_year = pd.DateOffset(years=1)
+    previous_data = ds.query_monthly_averages(
+        flight_columns,
+        airports=airports,
+        states=states,
+        start_date=None if start_date is None else pd.to_datetime(start_date) - previous_year,
+        end_date=None if end_date is None else pd.to_datetime(end_date) - previous_year
+    )
+    previous_data[c.YEAR] += 1
+    return graph_data.merge(
+        previous_data[[c.YEAR, c.MONTH_NUM] + flight_columns],
+        on=[c.YEAR, c.MONTH_NUM], how='left', suffixes=('', c.PREVIOUS_YEAR_SUFFIX)
+    )
+
+
+def get_map_data(map_mode, flight_columns, start_date=None, end_date=None):
+    """
+    Returns per state values of the map: daily average flights
+    over the period or number of flights on its last day
+    """
+    if map_mode == c.MAP_MODE_DAY:
+        final_date = pd.to_datetime(end_date)
+        return ds.query_daily_average_per_state(
+            flight_columns[:1],
+            start_date=final_date,
+            end_date=final_date
+        )
+    return ds.query_state_daily_averages(
+        flight_columns[:1],
+        start_date=start_date,
+        end_date=end_date
+    )
+
+
+def get_dashboard_tasks(flight_columns, airports=None, states=None, start_date=None,
+                        end_date=None, seasonal_mode=c.SEASONAL_MODE_COMBINED,
+                        map_mode=c.MAP_MODE_PERIOD, flights_mode=c.FLIGHTS_MODE_TOTAL):
+    """
+    Returns the aggregations of a dashboard update as tasks for run.
+    Compared entities are drawn with the NM column.
+    """
+    if flights_mode == c.FLIGHTS_MODE_COMPARE:
+        series_task = (
+            series.get_comparison_chart_series,
+            (flight_columns[0], airports, states, start_date, end_date)
+        )
+    else:
+        series_task = (
+            series.get_flights_chart_series,
+            (flight_columns, airports, states, start_date, end_date)
+        )
+    return {
+        'series': series_task,
+        'seasonal': (
+            get_seasonal_data,
+            (seasonal_mode, flight_columns, airports, states, start_date, end_date)
+        ),
+        'top_airports': (
+            ds.query_top_airports, (None, states, start_date, end_date)
+        ),
+        'map': (
+            get_map_data, (map_mode, flight_columns, start_date, end_date)
+        ),
+    }
@@ -0,0 +1,306 @@
+"""
+Cache of callback and API responses shared by the workers of a host.
+
+Responses are stored as bytes under a key made of the call name, its
+normalized inputs, the dataset version and a fingerprint of the settings
+changing responses and of the code, in a SQLite database or a
+directory (RESPONSE_CACHE=sqlite|filesystem, anything else disables it).
+The least recently used entries are evicted above RESPONSE_CACHE_MAX_MB,
+access times being kept to RESPONSE_CACHE_ACCESS_RESOLUTION seconds,
+and entries of other dataset versions are dropped when a worker sees
+a new version.
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import config
+import constants as c
+import data as ds
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteBackend:
+    """
+    Entries stored in a SQLite database, safe to share between processes
+    """
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        with self.connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, version TEXT, value BLOB, '
+                'size INTEGER, accessed REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)'
+            )
+
+    def connect(self):
+        """
+        Returns connection of the current thread. Connections are
+        not reused after forking, e.g. by preloaded gunicorn workers.
+        """
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.path, timeout=10)
+            self.local.connection.execute('PRAGMA journal_mode=WAL')
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def get(self, key, version):
+        """
+        Returns the stored value. The access time is only written when
+        it is older than RESPONSE_CACHE_ACCESS_RESOLUTION seconds, so that
+        most hits are reads and do not take the write lock.
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                'SELECT value, accessed FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] >= c.RESPONSE_CACHE_ACCESS_RESOLUTION:
+                connection.execute(
+                    'UPDATE responses SET accessed = ? WHERE key = ?', (now, key)
+                )
+        return row[0]
+
+    def set(self, key, version, value):
+        with self.connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (key, version, value, len(value), time.time())
+            )
+            total = connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = 0
+            for entry, size in connection.execute(
+                'SELECT key, size FROM responses ORDER BY accessed'
+            ).fetchall():
+                if total - evicted <= self.max_bytes:
+                    break
+                connection.execute('DELETE FROM responses WHERE key = ?', (entry,))
+                evicted += size
+
+    def invalidate(self, version):
+        with self.connect() as connection:
+            connection.execute('DELETE FROM responses WHERE version != ?', (version,))
+
+
+class FileSystemBackend:
+    """
+    Entries stored as files of a directory, named after
+    the dataset version and the key
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, key, version):
+        return os.path.join(self.directory, '{}-{}.json'.format(version, key))
+
+    def get(self, key, version):
+        path = self.get_path(key, version)
+        try:
+            with open(path, 'rb') as file:
+                value = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, version, value):
+        path = self.get_path(key, version)
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'wb') as file:
+            file.write(value)
+        os.replace(temporary_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(x[1] for x in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def invalidate(self, version):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') and not name.startswith(version + '-'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+def create_backend(kind=config.RESPONSE_CACHE):
+    """
+    Returns the configured backend or None if the cache is disabled
+    or cannot be opened
+    """
+    max_bytes = config.RESPONSE_CACHE_MAX_MB * 2 ** 20
+    try:
+        if kind == 'sqlite':
+            return SQLiteBackend(c.RESPONSE_CACHE_SQLITE_FILE, max_bytes)
+        if kind == 'filesystem':
+            return FileSystemBackend(c.RESPONSE_CACHE_DIR, max_bytes)
+    except (OSError, sqlite3.Error) as error:
+        logger.warning('Response cache disabled: %s', error)
+    return None
+
+
+def get_code_version(directory=os.path.dirname(os.path.abspath(__file__))):
+    """
+    Returns a digest of the Python sources of the app,
+    which changes with every deploy of different code
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            with open(os.path.join(directory, name), 'rb') as source:
+                digest.update(name.encode())
+                digest.update(source.read())
+    return digest.hexdigest()
+
+
+def get_fingerprint():
+    """
+    Returns a digest of the code and of every setting changing
+    responses for the same inputs and dataset version
+    """
+    settings = {
+        'TOP_AIRPORTS': config.TOP_AIRPORTS,
+        'TOP_AIRPORTS_MOVEMENT': config.TOP_AIRPORTS_MOVEMENT,
+        'TOP_AIRPORTS_STATISTIC': config.TOP_AIRPORTS_STATISTIC,
+        'FIGURE_DECIMALS': config.FIGURE_DECIMALS,
+        'CLIENTSIDE_MODE': config.CLIENTSIDE_MODE,
+        'SMOOTHING_WINDOW': c.SMOOTHING_WINDOW,
+        'SMOOTHING_ORDER': c.SMOOTHING_ORDER,
+        'MAX_CHART_POINTS': c.MAX_CHART_POINTS,
+        'MAX_COMPARED_SERIES': c.MAX_COMPARED_SERIES,
+        'MAP_SIMPLIFY_TOLERANCE': c.MAP_SIMPLIFY_TOLERANCE,
+    }
+    description = json.dumps([settings, get_code_version()], sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+backend = create_backend()
+seen_version = None
+fingerprint = get_fingerprint()
+
+
+def normalize_input(value):
+    """
+    Returns the input in a canonical form: selections are sorted,
+    empty selections are None
+    """
+    if isinstance(value, (list, tuple)):
+        return sorted(value, key=str) or None
+    return value
+
+
+def get_key(name, args, version):
+    """
+    Returns the cache key of a callback call
+    """
+    description = json.dumps(
+        [name, [normalize_input(x) for x in args], version, fingerprint],
+        default=str
+    )
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def check_version(version):
+    """
+    Drops entries of other dataset versions the first time
+    this process sees the version
+    """
+    global seen_version
+    if version == seen_version:
+        return
+    seen_version = version
+    backend.invalidate(version)
+
+
+def load(key, version):
+    """
+    Returns the stored value of the key or None
+    """
+    try:
+        check_version(version)
+        return backend.get(key, version)
+    except (OSError, sqlite3.Error) as error:
+        logger.warning('Response cache read failed: %s', error)
+        return None
+
+
+def store(key, version, value):
+    try:
+        backend.set(key, version, value)
+    except (OSError, sqlite3.Error) as error:
+        logger.warning('Response cache write failed: %s', error)
+
+
+def cached_callback(function):
+    """
+    Decorator returning stored responses of a callback
+    for the same inputs and dataset version
+    """
+    if backend is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args):
+        version = ds.get_snapshot().version
+        key = get_key(function.__name__, args, version)
+        value = load(key, version)
+        if value is not None:
+            return json.loads(value)
+
+        from plotly.io.json import to_json_plotly
+
+        result = function(*args)
+        store(key, version, to_json_plotly(result).encode())
+        return result
+    return wrapper
+
+
+def get_or_compute(name, args, compute):
+    """
+    Returns the stored bytes of a call for the same inputs and
+    dataset version, or stores and returns compute()
+    """
+    if backend is None:
+        return compute()
+    version = ds.get_snapshot().version
+    key = get_key(name, args, version)
+    value = load(key, version)
+    if value is None:
+        value = compute()
+        store(key, version, value)
+    return value
@@ -0,0 +1,102 @@
+"""
+Compact serialization of callback and API responses.
+
+Figures are encoded by plotly with orjson when it is installed, values
+are rounded to FIGURE_DECIMALS and daily date axes are sent as a first
+date and a step (or as dates without time when points are missing)
+instead of one ISO timestamp per point. Responses are compressed with
+brotli (gzip for clients without it) by Flask-Compress, and the size of
+every callback and API response is logged against RESPONSE_BUDGET_KB.
+"""
+import logging
+import numpy as np
+from flask import g, request
+from flask_compress import Compress
+import config
+
+try:
+    # plotly imports orjson on first use and takes it from sys.modules, where a
+    # callback thread could find it half initialized by another one
+    import orjson  # noqa: F401
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+DAY_MILLISECONDS = 86400000
+COMPRESS_ALGORITHMS = ['br', 'gzip']
+BROTLI_LEVEL = 4
+
+
+def round_values(values, decimals=config.FIGURE_DECIMALS):
+    """
+    Returns the values as a float array rounded to the displayed precision
+    """
+    return np.round(np.asarray(values, dtype=float), decimals)
+
+
+def date_axis(dates, axis='x'):
+    """
+    Returns trace properties of a date axis: first date and a step when
+    dates are evenly spaced days, dates without time otherwise
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    steps = np.diff(dates).astype(int)
+    if len(steps) and np.all(steps == steps[0]) and steps[0] > 0:
+        return {axis + '0': str(dates[0]), 'd' + axis: int(steps[0]) * DAY_MILLISECONDS}
+    return {axis: np.datetime_as_string(dates, unit='D').tolist()}
+
+
+def is_unchanged(etag):
+    """
+    Checks If-None-Match against the ETag, also in the forms
+    Flask-Compress gives it in compressed responses
+    """
+    return any(
+        request.if_none_match.contains(x) for x in [etag] + [
+            '{}:{}'.format(etag, algorithm) for algorithm in COMPRESS_ALGORITHMS
+        ]
+    )
+
+
+def is_budgeted():
+    return request.path.endswith('_dash-update-component') or request.path.startswith('/api/')
+
+
+def measure_response(response):
+    """
+    Keeps the size of the response before compression
+    """
+    if is_budgeted() and not response.is_streamed:
+        g.response_bytes = response.calculate_content_length() or 0
+    return response
+
+
+def check_response_budget(response):
+    """
+    Logs the size of every response, as a warning above the budget
+    """
+    size = g.get('response_bytes')
+    if size is None:
+        return response
+    sent = response.calculate_content_length() or 0
+    level = logging.WARNING if sent > config.RESPONSE_BUDGET_KB * 1024 else logging.INFO
+    logger.log(
+        level, '%s response of %.1f kB (%.1f kB %s), budget %d kB',
+        request.path, size / 1024, sent / 1024,
+        response.headers.get('Content-Encoding', 'uncompressed'), config.RESPONSE_BUDGET_KB
+    )
+    return response
+
+
+def init_app(server):
+    """
+    Registers compression and the response size check on the Flask
+    server. Hooks run in reverse order of registration, so the size is
+    measured before compression and checked after it.
+    """
+    server.after_request(check_response_budget)
+    server.config['COMPRESS_ALGORITHM'] = COMPRESS_ALGORITHMS
+    server.config['COMPRESS_BR_LEVEL'] = BROTLI_LEVEL
+    Compress(server)
+    server.after_request(measure_response)
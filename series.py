@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+import constants as c
+import data as ds
+import instrumentation
+from caching import LRUCache
+
+series_cache = LRUCache(c.SERIES_CACHE_SIZE, 'series')
+
+
+def get_smoothing_window(length, window=c.SMOOTHING_WINDOW,
+                         polyorder=c.SMOOTHING_ORDER):
+    """
+    Returns the largest odd smoothing window not longer than
+    the series, or None if the series is too short to be smoothed
+    """
+    window = min(window, length)
+    if window % 2 == 0:
+        window -= 1
+    if window <= polyorder:
+        return None
+    return window
+
+
+@instrumentation.timed_phase('smoothing')
+def smooth(values, window=c.SMOOTHING_WINDOW, polyorder=c.SMOOTHING_ORDER):
+    """
+    Smooths values with Savitzky-Golay filter, adapting the window
+    to the length of the series
+    """
+    # scipy takes a third of the import time of the app, it is loaded on first use
+    from scipy import signal
+
+    values = np.asarray(values, dtype=float)
+    window = get_smoothing_window(len(values), window, polyorder)
+    if window is None:
+        return values
+    return signal.savgol_filter(values, window, polyorder)
+
+
+@instrumentation.timed_phase('smoothing')
+def smooth_columns(values, window=c.SMOOTHING_WINDOW, polyorder=c.SMOOTHING_ORDER):
+    """
+    Smooths every column of a days x series matrix in one filter call.
+    Missing values are interpolated for the filter and stay missing.
+    """
+    from scipy import signal
+
+    values = np.asarray(values, dtype=float)
+    window = get_smoothing_window(len(values), window, polyorder)
+    if window is None:
+        return values
+    missing = np.isnan(values)
+    filled = values
+    if missing.any():
+        filled = pd.DataFrame(values).interpolate(limit_direction='both').fillna(0).values
+    smoothed = signal.savgol_filter(filled, window, polyorder, axis=0)
+    smoothed[missing] = np.nan
+    return smoothed
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Returns indices of at most threshold points keeping the visual
+    shape of the series; first and last points are always kept.
+    """
+    length = len(y)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, length - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    indices[-1] = length - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous]) -
+            (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+@instrumentation.timed_phase('smoothing')
+def downsample(x, y, max_points=c.MAX_CHART_POINTS):
+    """
+    Returns x and y reduced to at most max_points points
+    """
+    if len(y) <= max_points:
+        return x, y
+    indices = lttb(x.astype(np.int64), y, max_points)
+    return x[indices], y[indices]
+
+
+@instrumentation.timed_phase('smoothing')
+def downsample_columns(x, values, max_points=c.MAX_CHART_POINTS):
+    """
+    Returns x and the rows of the days x series matrix reduced to at
+    most max_points points by averaging bins of consecutive rows. All
+    series share the dates of the bins, which keep a regular step
+    when the rows do.
+    """
+    if len(values) <= max_points:
+        return x, values
+    starts = np.arange(0, len(values), -(-len(values) // max_points))
+    reported = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(reported, values, 0), starts, axis=0)
+    counts = np.add.reduceat(reported, starts, axis=0)
+    return x[starts], np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def get_flights_chart_series(flight_columns, airports=None, states=None,
+                             start_date=None, end_date=None,
+                             max_points=c.MAX_CHART_POINTS):
+    """
+    Returns smoothed and downsampled daily number of flights
+    as a dictionary: flight column -> (dates, values).
+    Results are memoized per filters.
+    """
+    key = ds.normalize_filter(airports, states, start_date, end_date) + (
+        tuple(flight_columns), max_points
+    )
+
+    def compute():
+        graph_data = ds.query_number_of_flights(
+            flight_columns,
+            airports=airports,
+            states=states,
+            start_date=start_date,
+            end_date=end_date
+        )
+        dates = graph_data[c.DATE].values
+        return {
+            column: downsample(dates, smooth(graph_data[column].values), max_points)
+            for column in flight_columns if column in graph_data.columns
+        }
+
+    return series_cache.get_or_compute(key, compute)
+
+
+def get_comparison_chart_series(flight_column, airports=None, states=None,
+                                start_date=None, end_date=None,
+                                max_points=c.MAX_CHART_POINTS):
+    """
+    Returns smoothed and downsampled daily number of flights of every
+    selected airport, or of every state when no airport is selected,
+    as a dictionary: entity -> (dates, values). The matrix of all
+    entities is smoothed and downsampled at once.
+    """
+    key = ds.normalize_filter(airports, states, start_date, end_date) + (
+        c.FLIGHTS_MODE_COMPARE, flight_column, max_points
+    )
+
+    def compute():
+        graph_data = ds.query_flights_by_group(
+            flight_column,
+            airports=airports,
+            states=states,
+            start_date=start_date,
+            end_date=end_date
+        )
+        names = list(graph_data.columns[1:])
+        dates, values = downsample_columns(
+            graph_data[c.DATE].values,
+            smooth_columns(graph_data[names].values),
+            max_points
+        )
+        return {name: (dates, values[:, index]) for index, name in enumerate(names)}
+
+    return series_cache.get_or_compute(key, compute)
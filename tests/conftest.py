@@ -0,0 +1,29 @@
+import os
+import sys
+
+os.environ.setdefault('PRELOAD_DATASET', '0')
+os.environ.setdefault('RESPONSE_CACHE', 'none')
+os.environ.setdefault('WARMUP', '0')
+os.environ.setdefault('INSTRUMENTATION', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+import data as ds
+from benchmarks.synthetic import generate_dataset
+
+SCALE = 0.05
+MISSING_SHARE = 0.1
+
+
+@pytest.fixture(scope='session')
+def snapshot():
+    """
+    Swaps in a snapshot of a small synthetic dataset with a share of
+    the airport days missing, so that days and months have gaps
+    """
+    data = generate_dataset(SCALE)
+    kept = np.random.default_rng(1).random(len(data)) >= MISSING_SHARE
+    snapshot = ds.DatasetSnapshot(data[kept], 'tests')
+    ds.swap_snapshot(snapshot)
+    return snapshot
@@ -0,0 +1,32 @@
+import importlib
+import pytest
+import constants as c
+import data as ds
+
+
+@pytest.fixture(scope='module')
+def app(snapshot):
+    # The layout is built when the module is imported, from the swapped in snapshot
+    return importlib.import_module('app')
+
+
+@pytest.mark.parametrize('seasonal_mode', [
+    c.SEASONAL_MODE_COMBINED, c.SEASONAL_MODE_YEARS, c.SEASONAL_MODE_PREVIOUS
+])
+@pytest.mark.parametrize('filters', [
+    {'states': ['Nope']},
+    {'start_date': 'after_last', 'end_date': 'after_last'},
+])
+def test_dashboard_of_empty_periods(app, snapshot, seasonal_mode, filters):
+    after_last = snapshot.last_date + ds.timedelta(days=1)
+    filters = {
+        key: after_last if value == 'after_last' else value for key, value in filters.items()
+    }
+    result = app.update_dashboard(
+        None, filters.get('states'), [],
+        filters.get('start_date', snapshot.first_date),
+        filters.get('end_date', snapshot.last_date),
+        seasonal_mode, c.MAP_MODE_PERIOD, c.FLIGHTS_MODE_TOTAL
+    )
+    seasonal = result[1]
+    assert all(len(trace.y) == 0 for trace in seasonal.data)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+import constants as c
+import data as ds
+
+FLIGHT_COLUMNS = [c.NM_TOTAL_FLIGHTS, c.AIRPORT_TOTAL_FLIGHTS]
+
+
+@pytest.mark.parametrize('start_date, end_date', [
+    ('2016-03-01', '2016-03-15'),
+    ('2016-01-01', '2016-01-10'),
+    ('2016-03-05', '2016-03-31'),
+    ('2016-03-05', '2016-03-20'),
+    ('2016-02-01', '2016-04-15'),
+    ('2016-02-10', '2016-04-30'),
+    ('2016-02-01', '2016-04-30'),
+])
+def test_monthly_averages_of_cut_months(snapshot, start_date, end_date):
+    expected = ds.get_average_per_month(
+        ds.filter_dataset(snapshot.data, start_date=start_date, end_date=end_date),
+        FLIGHT_COLUMNS
+    )
+    result = ds.query_monthly_averages(
+        FLIGHT_COLUMNS, start_date=start_date, end_date=end_date, by_year=False
+    )
+    assert list(result[c.MONTH_NUM]) == list(expected[c.MONTH_NUM])
+    np.testing.assert_allclose(
+        result[FLIGHT_COLUMNS].values, expected[FLIGHT_COLUMNS].values, rtol=1e-6
+    )
+
+
+@pytest.fixture(scope='module')
+def appended_snapshots(snapshot):
+    """
+    Returns a snapshot built from the dataset in one go and one built
+    from its first part with the rest appended as two deltas, an
+    airport only appearing in the last one
+    """
+    data = snapshot.data
+    late_airport = data[c.AIRPORT_NAME].cat.categories[0]
+    dates = data[c.DATE]
+    split_dates = [pd.Timestamp('2016-09-14'), pd.Timestamp('2017-01-31')]
+    early = dates <= split_dates[1]
+    kept = ~early | (data[c.AIRPORT_NAME] != late_airport).values
+    data = data[kept]
+    dates = data[c.DATE]
+    base = ds.DatasetSnapshot(data[dates <= split_dates[0]], 'base')
+    appended = base.appended(
+        data[(dates > split_dates[0]) & (dates <= split_dates[1])], 'first', 'first'
+    ).appended(data[dates > split_dates[1]], 'second', 'second')
+    return base, appended, ds.DatasetSnapshot(data, 'full')
+
+
+def test_appended_snapshot_shares_rows_and_prefix_arrays(appended_snapshots):
+    base, appended, _ = appended_snapshots
+    assert appended.data.data is base.data
+    for column in FLIGHT_COLUMNS:
+        assert appended.cube.sums[column].segments[0] is base.cube.sums[column]
+        assert len(appended.cube.sums[column].segments) == 3
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'start_date': '2016-09-01', 'end_date': '2016-10-10'},
+    {'start_date': '2016-09-15', 'end_date': '2017-02-28'},
+    {'states': ['State 01', 'State 07'], 'start_date': '2016-08-01'},
+    {'airports': ['Airport 00000', 'Airport 00003'], 'end_date': '2017-02-15'},
+])
+def test_appended_snapshot_answers_like_full_build(appended_snapshots, filters):
+    _, appended, full = appended_snapshots
+    results = []
+    for snapshot in [appended, full]:
+        with ds.pinned_snapshot(snapshot):
+            results.append([
+                ds.query_number_of_flights(FLIGHT_COLUMNS, **filters),
+                ds.query_flights_by_group(c.NM_TOTAL_FLIGHTS, **filters),
+                ds.query_monthly_averages(FLIGHT_COLUMNS, **filters),
+                ds.query_top_flight_airports('NM', **filters),
+                ds.query_daily_average_per_state(FLIGHT_COLUMNS, **filters),
+                ds.filter_dataset(snapshot.data, **filters).reset_index(drop=True),
+            ])
+    for result, expected in zip(*results):
+        pd.testing.assert_frame_equal(
+            result, expected, check_dtype=False, check_categorical=False
+        )
@@ -0,0 +1,96 @@
+import importlib
+import json
+import threading
+import time
+import pytest
+import constants as c
+import instrumentation
+
+
+@pytest.fixture(scope='module')
+def client(snapshot):
+    if not instrumentation.ENABLED:
+        pytest.skip('INSTRUMENTATION is not enabled')
+    return importlib.import_module('app').server.test_client()
+
+
+def get_dashboard_request(client, snapshot):
+    dependency = [
+        x for x in client.get('/_dash-dependencies').get_json()
+        if 'flights_mode.value' in [
+            '{}.{}'.format(y['id'], y['property']) for y in x['inputs']
+        ]
+    ][0]
+    values = [
+        None, None, [], str(snapshot.first_date.date()), str(snapshot.last_date.date()),
+        c.SEASONAL_MODE_COMBINED, c.MAP_MODE_PERIOD, c.FLIGHTS_MODE_TOTAL
+    ]
+    return {
+        'output': dependency['output'],
+        'outputs': [],
+        'inputs': [dict(x, value=y) for x, y in zip(dependency['inputs'], values)],
+        'state': [],
+        'changedPropIds': []
+    }
+
+
+def get_metric(client, line_start):
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        if line.startswith(line_start):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def get_metric_sum(client, metric):
+    return get_metric(client, metric + '_sum{callback="update_dashboard"}')
+
+
+def test_response_bytes_are_measured_before_compression(client, snapshot):
+    brotli = pytest.importorskip('brotli')
+    before = get_metric_sum(client, 'dash_callback_response_bytes')
+    response = client.post(
+        '/_dash-update-component', json=get_dashboard_request(client, snapshot),
+        headers={'Accept-Encoding': 'br'}
+    )
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'br'
+    body = brotli.decompress(response.data)
+    json.loads(body)
+    after = get_metric_sum(client, 'dash_callback_response_bytes')
+    assert after - before == len(body)
+
+
+def test_cache_counters_are_exposed(client, snapshot):
+    payload = get_dashboard_request(client, snapshot)
+    payload['inputs'][1]['value'] = ['State 01']
+    hits = get_metric(client, 'cache_hits_total{cache="series"}')
+    misses = get_metric(client, 'cache_misses_total{cache="series"}')
+    for _ in range(2):
+        assert client.post('/_dash-update-component', json=payload).status_code == 200
+    assert get_metric(client, 'cache_misses_total{cache="series"}') > misses
+    assert get_metric(client, 'cache_hits_total{cache="series"}') > hits
+    assert get_metric(client, 'cache_entries{cache="series"}') > 0
+
+
+def test_overlapping_phases_count_their_union():
+    if not instrumentation.ENABLED:
+        pytest.skip('INSTRUMENTATION is not enabled')
+    instrumentation.local.recorder = recorder = instrumentation.PhaseRecorder()
+    started = threading.Event()
+
+    def aggregate():
+        with instrumentation.phase('aggregate'):
+            started.set()
+            time.sleep(0.2)
+
+    try:
+        with instrumentation.phase('aggregate'):
+            worker = threading.Thread(target=instrumentation.bind_phases(aggregate))
+            worker.start()
+            started.wait()
+            with instrumentation.phase('aggregate'):
+                time.sleep(0.15)
+        worker.join()
+    finally:
+        instrumentation.local.recorder = None
+    assert 0.2 <= recorder.durations['aggregate'] < 0.3
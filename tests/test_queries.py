@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+import constants as c
+import data as ds
+from benchmarks.bench_data import FLIGHT_COLUMNS, get_filter_shapes
+
+EXTRA_SHAPES = {
+    'empty_period': {'start_date': '2030-01-01', 'end_date': '2030-01-31'},
+    'reversed_period': {'start_date': '2016-03-10', 'end_date': '2016-03-01'},
+    'unknown_state': {'states': ['Nope']},
+    'airport_outside_states': {'airports': ['Airport 00000'], 'states': ['Nope']},
+    'single_day': {'start_date': '2016-06-15', 'end_date': '2016-06-15'},
+    'month_boundaries': {'start_date': '2016-02-01', 'end_date': '2016-04-30'},
+    'from_month_start': {'start_date': '2016-03-01', 'end_date': '2016-05-17'},
+    'to_month_end': {'start_date': '2016-03-12', 'end_date': '2016-05-31'},
+    'year_boundary': {
+        'states': ['State 03', 'State 11'], 'start_date': '2016-12-01', 'end_date': '2017-01-31'
+    },
+}
+
+
+def get_shapes(snapshot):
+    return dict(get_filter_shapes(snapshot), **EXTRA_SHAPES)
+
+
+SHAPE_NAMES = [
+    'full_range', 'single_airport', 'several_states', 'one_month', 'states_one_year'
+] + list(EXTRA_SHAPES)
+
+
+@pytest.fixture(params=SHAPE_NAMES)
+def filters(request, snapshot):
+    return get_shapes(snapshot)[request.param]
+
+
+def assert_frames_equal(result, expected):
+    if expected.empty:
+        # pivot_table leaves the value columns out without rows,
+        # queries keep them for the charts
+        assert result.empty
+        assert set(expected.columns) <= set(result.columns)
+        return
+    assert list(result.columns) == list(expected.columns)
+    assert len(result) == len(expected)
+    for column in result.columns:
+        values = np.asarray(result[column])
+        expected_values = np.asarray(expected[column])
+        if values.dtype.kind in 'fiu':
+            np.testing.assert_allclose(
+                values.astype(float), expected_values.astype(float), rtol=1e-6
+            )
+        else:
+            assert list(values.astype(str)) == list(expected_values.astype(str))
+
+
+def test_number_of_flights(snapshot, filters):
+    expected = ds.get_number_of_flights(
+        ds.filter_dataset(snapshot.data, **filters), FLIGHT_COLUMNS
+    )
+    with ds.pinned_snapshot(snapshot):
+        result = ds.query_number_of_flights(FLIGHT_COLUMNS, **filters)
+    assert_frames_equal(result, expected)
+
+
+@pytest.mark.parametrize('source', ['NM', 'APT'])
+def test_top_flight_airports(snapshot, filters, source):
+    expected = ds.get_top_flight_airports(
+        ds.filter_dataset(snapshot.data, **filters), source
+    )
+    with ds.pinned_snapshot(snapshot):
+        result = ds.query_top_flight_airports(source, **filters)
+    assert_frames_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_daily_average_per_state(snapshot, filters):
+    expected = ds.get_daily_average_per_state(
+        ds.filter_dataset(snapshot.data, **filters), FLIGHT_COLUMNS
+    )
+    with ds.pinned_snapshot(snapshot):
+        result = ds.query_daily_average_per_state(FLIGHT_COLUMNS, **filters)
+    assert_frames_equal(result, expected.reset_index(drop=True))
+
+
+def test_average_per_month(snapshot, filters):
+    expected = ds.get_average_per_month(
+        ds.filter_dataset(snapshot.data, **filters), FLIGHT_COLUMNS
+    )
+    with ds.pinned_snapshot(snapshot):
+        result = ds.query_monthly_averages(FLIGHT_COLUMNS, **filters, by_year=False)
+    assert_frames_equal(result, expected)
@@ -0,0 +1,21 @@
+import constants as c
+import response_cache
+
+
+def test_sqlite_hits_only_write_stale_access_times(tmp_path):
+    backend = response_cache.SQLiteBackend(str(tmp_path / 'cache.sqlite'), 2 ** 20)
+    backend.set('key', 'version', b'value')
+    connection = backend.connect()
+    changes = connection.total_changes
+    for _ in range(3):
+        assert backend.get('key', 'version') == b'value'
+    assert connection.total_changes == changes
+
+    stale = connection.execute('SELECT accessed FROM responses').fetchone()[0] - (
+        c.RESPONSE_CACHE_ACCESS_RESOLUTION + 1
+    )
+    with connection:
+        connection.execute('UPDATE responses SET accessed = ?', (stale,))
+    assert backend.get('key', 'version') == b'value'
+    assert connection.execute('SELECT accessed FROM responses').fetchone()[0] > stale
+    assert backend.get('missing', 'version') is None
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+import config
+import constants as c
+import data as ds
+
+logger = logging.getLogger(__name__)
+
+ALL_MOVEMENTS = ['Arrival', 'Departure']
+
+
+def get_top_states(snapshot, number_of_states):
+    """
+    Returns states with the most NM flights over the whole dataset
+    """
+    cube = snapshot.cube
+    start, stop = cube.date_range()
+    totals = cube.per_state(
+        cube.range_sums(c.NM_TOTAL_FLIGHTS, start, stop), cube.airport_mask()
+    )
+    order = np.argsort(totals)[::-1][:number_of_states]
+    return [cube.states[x] for x in order]
+
+
+def get_popular_filters(snapshot, path=c.WARMUP_FILTERS_FILE,
+                        number_of_states=config.WARMUP_TOP_STATES):
+    """
+    Returns filter combinations to precompute after the default view:
+    the ones listed in the warm-up file, followed by the top states
+    """
+    filters = []
+    if os.path.exists(path):
+        with open(path) as file:
+            filters.extend(
+                {'airports': x.get('airports'), 'states': x.get('states')}
+                for x in json.load(file)
+            )
+    filters.extend(
+        {'airports': None, 'states': [x]}
+        for x in get_top_states(snapshot, number_of_states)
+    )
+    return filters
+
+
+def get_default_period(snapshot):
+    """
+    Returns start and end date sent by the date picker of a new page
+    """
+    return ds.format_date(snapshot.first_date), ds.format_date(snapshot.last_date)
+
+
+def run(calls, budget=config.WARMUP_BUDGET_SECONDS):
+    """
+    Calls every (name, function, args) in order until the time
+    budget in seconds is spent. Returns number of calls made.
+    """
+    start = time.perf_counter()
+    done = 0
+    for name, function, args in calls:
+        if time.perf_counter() - start > budget:
+            logger.warning(
+                'Warm-up budget of %s s exceeded, %d calls skipped',
+                budget, len(calls) - done
+            )
+            break
+        try:
+            function(*args)
+        except Exception:
+            logger.exception('Warm-up of %s%s failed', name, args)
+        done += 1
+    logger.info(
+        'Warmed up %d callback calls in %.3f s', done, time.perf_counter() - start
+    )
+    return done
+
+
+def start(get_calls):
+    """
+    Loads the dataset and runs the calls returned by get_calls
+    in a background thread, so that the process keeps serving
+    requests from the dataset summary meanwhile
+    """
+    def load():
+        start_time = time.perf_counter()
+        ds.get_snapshot()
+        logger.info('Dataset loaded in background in %.3f s', time.perf_counter() - start_time)
+        if config.WARMUP:
+            run(get_calls())
+
+    threading.Thread(target=load, name='warmup', daemon=True).start()